@@ -10,9 +10,10 @@ CAENHV_GetSysPropList returns 0 system properties and a null pointer
 """
 import sys
 import os
+import json
 import pprint
 from enum import IntEnum
-from ctypes import c_int, c_float, c_void_p, c_char_p, c_char, c_ushort, pointer, cdll, cast, POINTER, byref, sizeof, c_ulong, c_uint32, c_long, c_short, create_string_buffer, c_uint8
+from ctypes import c_int, c_float, c_void_p, c_char_p, c_char, c_ushort, pointer, cdll, cast, POINTER, byref, sizeof, c_ulong, c_uint32, c_long, c_short, create_string_buffer, c_uint8, c_uint, Structure, Union
 
 class CAENR8033DM:
     def __init__(self, json_data):
@@ -28,6 +29,7 @@ class CAENR8033DM:
         self.num_of_channels = 16
         self.board_params = {}
         self.ch_params = {}
+        self.call_plans = {}            #Reusable buffers for channel get/set calls, see get_call_plan()
         self.json_data = json_data
 
         try:
@@ -38,6 +40,7 @@ class CAENR8033DM:
             sys.exit(f"{self.prefix} --> Could not load CAEN's C library at {dllpath}")
 
         print(f"{self.prefix} --> CAEN's C library opened at {dllpath}")
+        self.declare_signatures()
 
         #Integer handler for the connection
         self.caen = c_int()
@@ -53,8 +56,11 @@ class CAENR8033DM:
 
         self.get_crate_info()
         #self.get_sys_info()
-        self.get_board_info()
-        self.get_channel_info()
+        #Walking every parameter's properties takes around a thousand calls, so they're cached on disk for the next time this crate connects
+        if (not self.load_param_cache()):
+            self.get_board_info()
+            self.get_channel_info()
+            self.save_param_cache()
         #self.get_channel_parameter_value([12,5, 2, 9, 14], "VSet")
         #self.get_channel_name(5)
         #self.get_channel_name([12,5, 2, 9, 14])
@@ -76,6 +82,38 @@ class CAENR8033DM:
         #print("Board level properties are:")
         #pprint.pprint(self.board_params, width = 1)
 
+    #Tells ctypes the argument and return types of every library function used, from CAENHVWrapper.h
+    #Without this, ctypes has to guess the conversion of every argument on every call, and a wrong guess isn't caught
+    #Pointer arguments are void pointers so the arrays and byref() results used throughout can be passed directly
+    def declare_signatures(self):
+        lib = self.libcaenhvwrapper
+        signatures = {
+            "CAENHV_InitSystem": [c_int, c_int, c_char_p, c_char_p, c_char_p, c_void_p],
+            "CAENHV_DeinitSystem": [c_int],
+            "CAENHV_GetCrateMap": [c_int, c_void_p, c_void_p, c_void_p, c_void_p, c_void_p, c_void_p, c_void_p],
+            "CAENHV_GetSysPropList": [c_int, c_void_p, c_void_p],
+            "CAENHV_GetBdParamInfo": [c_int, c_ushort, c_void_p],
+            "CAENHV_GetBdParamProp": [c_int, c_ushort, c_char_p, c_char_p, c_void_p],
+            "CAENHV_GetBdParam": [c_int, c_ushort, c_void_p, c_char_p, c_void_p],
+            "CAENHV_SetBdParam": [c_int, c_ushort, c_void_p, c_char_p, c_void_p],
+            "CAENHV_GetChParamInfo": [c_int, c_ushort, c_ushort, c_void_p, c_void_p],
+            "CAENHV_GetChParamProp": [c_int, c_ushort, c_ushort, c_char_p, c_char_p, c_void_p],
+            "CAENHV_GetChParam": [c_int, c_ushort, c_char_p, c_ushort, c_void_p, c_void_p],
+            "CAENHV_SetChParam": [c_int, c_ushort, c_char_p, c_ushort, c_void_p, c_void_p],
+            "CAENHV_GetChName": [c_int, c_ushort, c_ushort, c_void_p, c_void_p],
+            "CAENHV_SubscribeChannelParams": [c_int, c_ushort, c_ushort, c_ushort, c_char_p, c_uint, c_void_p],
+            "CAENHV_UnSubscribeChannelParams": [c_int, c_ushort, c_ushort, c_ushort, c_char_p, c_uint, c_void_p],
+            "CAENHV_GetEventData": [c_int, c_void_p, c_void_p, c_void_p],
+            "CAENHV_FreeEventData": [c_void_p],
+        }
+        for name, argtypes in signatures.items():
+            function = getattr(lib, name)
+            function.argtypes = argtypes
+            function.restype = c_int        #CAENHVRESULT
+        #Looked up once here instead of through the library object every call
+        self.get_ch_param_function = lib.CAENHV_GetChParam
+        self.set_ch_param_function = lib.CAENHV_SetChParam
+
     def __del__(self):
         return_code = self.libcaenhvwrapper.CAENHV_DeinitSystem(self.caen)
         self.check_return(return_code, "Disconnection Failed", "Disconnected")
@@ -100,6 +138,13 @@ class CAENR8033DM:
                                                             byref(c_firmware_releae_max_list))
         self.check_return(return_code, "Failed to get crate map", f"Communicating with Caen {c_model_list.value.decode('utf-8')}, serial number {c_serial_num_list.contents.value} with {c_num_of_slots.value} slots and {c_num_of_channels.contents.value} channels detected")
         self.channel_list = c_num_of_channels.contents
+        #The firmware lists are actually one byte per slot, the release is max.min
+        c_firmware_min = cast(c_firmware_release_min_list, POINTER(c_uint8))
+        c_firmware_max = cast(c_firmware_releae_max_list, POINTER(c_uint8))
+        #This is what identifies the crate for the parameter cache
+        self.crate_info = {"Model": c_model_list.value.decode('utf-8'),
+                           "Serial": c_serial_num_list.contents.value,
+                           "Firmware": f"{c_firmware_max[0]}.{c_firmware_min[0]:02d}"}
 
     #This function always returns nothing
     def get_sys_info(self):
@@ -119,6 +164,12 @@ class CAENR8033DM:
     #This function gets the parameters at the full board level, such as board interlock status, or Vmax set by trimmer
     #It then gets the properties of those parameters (Float, read only, etc...) and their current value and makes a dictionary
     def get_board_info(self):
+        board_params = self.get_board_param_names()
+        for i in board_params:
+            self.get_board_property_info(i)
+            self.get_board_parameter_value(i)
+
+    def get_board_param_names(self):
         c_slot_num = c_ushort(self.slot)
         c_bd_param_list = c_char_p()
         #Function takes in a **char type as the parameter list. It will write back an array of char arrays
@@ -127,13 +178,16 @@ class CAENR8033DM:
                                                             byref(c_bd_param_list))
 
         self.check_return(return_code, "Failed to get board parameters")
+        return self.parse_param_list(c_bd_param_list)
 
+    #Both the board and channel parameter info functions write back a list of parameter names in the same way
+    def parse_param_list(self, c_param_list):
         #Cast as a pointer to 10 char arrays. The type is
         #<class 'caen_r8033dm.LP_c_char_Array_10'>
         #You need to just "know" that each parameter fills 10 chars, either with terminating null characters or gibberish
         #I confirmed by reading out the full memory block, and also through the example C script
 
-        par_array = cast(c_bd_param_list, (POINTER(c_char * self.board_param_size)))
+        par_array = cast(c_param_list, (POINTER(c_char * self.board_param_size)))
 
         #If you run par_array.contents, the type is <class 'caen_r8033dm.c_char_Array_10'> and the size is 10
         #But printing it just gives <caen_r8033dm.c_char_Array_10 object at 0x7ff81f8cfe30>
@@ -146,7 +200,7 @@ class CAENR8033DM:
         #These can be decoded through utf-8 or left as is to be passed back to other functions
 
         i = 0
-        board_params = []
+        params = []
 
         #It's hard to know how many parameters there will be. Even in Caen's example code, they just loop until the pointer to char array is not valid
         #In this Ctypes way, we can go until the resulting 10 char array is either empty '' which happens. Or it's not alphanumeric characters
@@ -154,14 +208,11 @@ class CAENR8033DM:
         while (True):
             result = par_array[i].value.decode('utf-8')
             if (result.isalnum()):
-                board_params.append(result)
+                params.append(result)
                 i += 1
             else:
                 break
-
-        for i in board_params:
-            self.get_board_property_info(i)
-            self.get_board_parameter_value(i)
+        return params
 
     #Every parameter has at least 2 properties, Type (float or long or binary, etc...) and Mode (read only, read/write, etc...)
     #I get those and then depending on the type, there are other implied properties
@@ -269,7 +320,17 @@ class CAENR8033DM:
     #Parameters are things like the voltae setting, the ramp down speed, the current trigger setting and so on
     #Their properties are things like "Float" or "Binary" or "Read only" or "Max value"
     def get_channel_info(self):
-        c_par_num = c_ushort()
+        ch_params = self.get_channel_param_names()
+        #After making a list of all the parameter names, I programmatically ask the instrument for all the properties about that parameter
+        #In order to make a big dictionary with every channel's parameters, and their properties and values
+        for ch in range(self.num_of_channels):
+            for i in ch_params:
+                self.get_channel_property_info(ch, i)       #First get the properties of the value, so you know if it's a float, long, etc...
+                if (self.ch_params[ch][i]['Mode'] != self.PropertyMode.PARAM_MODE_WRONLY.name):
+                    self.get_channel_parameter_value(ch, i)     #Then use that to get the current value and fill it in, write only ones have none
+
+    def get_channel_param_names(self):
+        c_par_num = c_int()
         c_par_list = c_char_p()
         return_code = self.libcaenhvwrapper.CAENHV_GetChParamInfo(self.caen,
                                                             c_ushort(self.slot),    #Only 1 slot on this device
@@ -278,24 +339,60 @@ class CAENR8033DM:
                                                             byref(c_par_num))       #Returns the number of parameters. I already know empirically that it's 11. But I find the array size programmatically below anyway
 
         self.check_return(return_code, f"Failed to get channel info")
-
-        #See comments in board info function for what happens here
-        par_array = cast(c_par_list, (POINTER(c_char * self.board_param_size)))
-        i = 0
-        ch_params = []
-        while (True):
-            result = par_array[i].value.decode('utf-8')
-            if (result.isalnum()):
-                ch_params.append(result)
-                i += 1
-            else:
-                break
-        #After making a list of all the parameter names, I programmatically ask the instrument for all the properties about that parameter
-        #In order to make a big dictionary with every channel's parameters, and their properties and values
-        for ch in range(self.num_of_channels):
-            for i in ch_params:
-                self.get_channel_property_info(ch, i)       #First get the properties of the value, so you know if it's a float, long, etc...
-                self.get_channel_parameter_value(ch, i)     #Then use that to get the current value and fill it in
+        return self.parse_param_list(c_par_list)
+
+    #The cache file holds the properties (Type, Mode, Minval, Maxval, Unit, Exp, Decimal...) of every board and channel parameter, but not their values
+    #It's only used if it was made for the same model, serial number and firmware as the crate that's connected, and if the crate still lists the same parameter names
+    #Otherwise the properties are walked like normal and the cache is rewritten. Delete the file to force that
+    def load_param_cache(self):
+        cache_path = os.path.join(os.getcwd(), self.json_data['caenR8033DM_cache'])
+        if (not os.path.isfile(cache_path)):
+            print(f"{self.prefix} --> No parameter cache at {cache_path}, reading parameter properties from the crate")
+            return False
+        try:
+            with open(cache_path, 'r') as f:
+                cache = json.load(f)
+            board_params = cache['board_params']
+            #JSON keys are always strings, the channel numbers need to go back to ints
+            ch_params = {int(ch): params for ch, params in cache['ch_params'].items()}
+            crate_info = cache['crate_info']
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            print(f"{self.prefix} --> Parameter cache at {cache_path} could not be read ({e}), reading parameter properties from the crate")
+            return False
+        if (crate_info != self.crate_info):
+            print(f"{self.prefix} --> Parameter cache at {cache_path} was made for {crate_info}, not this crate {self.crate_info}. Reading parameter properties from the crate")
+            return False
+        #Two calls to make sure the crate hasn't changed its parameter list
+        ch_names = self.get_channel_param_names()
+        if ((sorted(board_params) != sorted(self.get_board_param_names())) or
+            (sorted(ch_params) != list(range(self.num_of_channels))) or
+            any(sorted(ch_params[ch]) != sorted(ch_names) for ch in ch_params)):
+            print(f"{self.prefix} --> Parameter cache at {cache_path} doesn't match the crate's parameter list. Reading parameter properties from the crate")
+            return False
+        self.board_params = board_params
+        self.ch_params = ch_params
+        #Values still have to come from the crate, but each channel parameter is read for all channels in one call
+        for i in self.board_params:
+            self.get_board_parameter_value(i)
+        for i in ch_names:
+            if (self.ch_params[0][i]['Mode'] != self.PropertyMode.PARAM_MODE_WRONLY.name):
+                self.get_channel_parameter_value(list(range(self.num_of_channels)), i)
+        print(f"{self.prefix} --> Loaded parameter properties from cache at {cache_path}")
+        return True
+
+    def save_param_cache(self):
+        cache_path = os.path.join(os.getcwd(), self.json_data['caenR8033DM_cache'])
+        cache = {}
+        cache['crate_info'] = self.crate_info
+        cache['board_params'] = {param: {prop: val for prop, val in props.items() if prop != "Value"} for param, props in self.board_params.items()}
+        cache['ch_params'] = {ch: {param: {prop: val for prop, val in props.items() if prop != "Value"} for param, props in params.items()} for ch, params in self.ch_params.items()}
+        try:
+            with open(cache_path, 'w') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=4)
+        except OSError as e:
+            print(f"{self.prefix} --> WARNING: Could not write the parameter cache to {cache_path}: {e}")
+            return
+        print(f"{self.prefix} --> Saved parameter properties to cache at {cache_path}")
 
     #Every parameter has at least 2 properties, Type (float or long or binary, etc...) and Mode (read only, read/write, etc...)
     #I get those and then depending on the type, there are other implied properties
@@ -396,44 +493,37 @@ class CAENR8033DM:
     #This does that and adds it to the dictionary
     #This can be called with a single channel or a list of channels because the C function allows both
     #If called with a single int for channel, I make it a list of that one int so it works the same
-    def get_channel_parameter_value(self, chns, param):
+    #Bulk monitor reads can turn off the rounding, small leakage currents are below the rounding factor
+    def get_channel_parameter_value(self, chns, param, round_values = True):
         if (isinstance(chns, int)):
-            chns = [chns]
-        size = len(chns)
-        for ch in chns:
-            if param not in self.ch_params[ch]:
-                sys.exit(f"{self.prefix} --> Tried to access parameter{param} which wasn't in the channel parameter list. Channel {ch} parameter list is {self.ch_params[ch]}")
-            if (('Type' not in self.ch_params[ch][param]) or ('Mode' not in self.ch_params[ch][param])):
-                sys.exit(f"{self.prefix} --> Tried to access parameter{param} which didn't have Type and Mode set up in the channel parameter list. Channel {ch} parameter list is {self.ch_params[ch]}")
-            if (self.ch_params[ch][param]['Mode'] == self.PropertyMode.PARAM_MODE_WRONLY):
-                sys.exit(f"{self.prefix} --> Trying to read a parameter that is read only. Channel {ch} parameter list is {self.ch_params[ch]}")
-        if (self.ch_params[chns[0]][param]['Type'] == self.PropertyType.PARAM_TYPE_FLOAT.name):
-            c_param_val = (c_float * size)()
-        else:
-            c_param_val = (c_uint32 * size)()
-        c_ch_list = (c_ushort * size)()
-        for num,ch in enumerate(chns):
-            c_ch_list[num] = ch
-        return_code = self.libcaenhvwrapper.CAENHV_GetChParam(self.caen,
-                                                            c_ushort(self.slot),
-                                                            param.encode('utf-8'),      #Parameter to read
-                                                            c_ushort(size),             #Number of channels you want to read (say 3)
-                                                            byref(c_ch_list),           #Which specific channels you want to read (say 12, 5, and 8 in that order)
-                                                            byref(c_param_val))         #Will return that many floats or longs, organized in the way you called it
-        if (self.check_return(return_code, f"Retrieving value for channels {chns}, parameter {param} failed") == 0):
-            for num,ch in enumerate(chns):
-                self.ch_params[ch][param]["Value"] = c_param_val[num]
+            chns = (chns,)
+        plan = self.call_plans.get(("get", param, tuple(chns)))
+        if (plan is None):
+            plan = self.get_call_plan("get", chns, param)
+        return_code = self.get_ch_param_function(self.caen,
+                                                self.slot,
+                                                plan.param,         #Parameter to read
+                                                plan.size,          #Number of channels you want to read (say 3)
+                                                plan.ch_list,       #Which specific channels you want to read (say 12, 5, and 8 in that order)
+                                                plan.values)        #Will return that many floats or longs, organized in the way you called it
+        values = plan.values[:]
+        if (return_code == 0):
+            for entry, value in zip(plan.entries, values):
+                entry["Value"] = value
         else:
-            for ch in chns:
-                self.ch_params[ch][param]["Value"] = self.error
+            self.check_return(return_code, f"Retrieving value for channels {list(chns)}, parameter {param} failed")
+            for entry in plan.entries:
+                entry["Value"] = self.error
 
         #I realized that upstream functions want this value returned to them
         #Since this function can accept a single value or an array, return what was passed in
         #Floats are rounded to make the comparison for a write easier
-        if (len(chns) == 1):
-            return c_param_val[0]
+        if (plan.size == 1):
+            return values[0]
+        elif (round_values):
+            return [round(i,self.rounding_factor) for i in values]
         else:
-            return [round(i,self.rounding_factor) for i in c_param_val]
+            return values
 
     #This is a curious function. You pass in a channel like 5 and it returns "CH05"
     #And you can ask for multiple, say channels 12, 4, and 8. Sure enough, you get "Ch12, Ch04, Ch08"
@@ -493,39 +583,93 @@ class CAENR8033DM:
     #If only one value is given, then I apply that to all the channels. If not, the arrays have to be the same size so each value maps to a channel for writing
     def set_ch_parameter(self, chns, param, vals):
         if (isinstance(chns, int)):
-            chns = [chns]
+            chns = (chns,)
         if (not isinstance(vals, list)):
             vals = [vals]
-        if ((len(chns) != len(vals)) and (len(vals) != 1)):
+        plan = self.call_plans.get(("set", param, tuple(chns)))
+        if (plan is None):
+            plan = self.get_call_plan("set", chns, param)
+        if (len(vals) == 1):
+            plan.values[:] = vals * plan.size       #This line is where every channel is set to the same value
+        elif (len(vals) == plan.size):
+            plan.values[:] = vals
+        else:
             sys.exit(f"{self.prefix} --> Incorrect use of set_ch_parameter! The number of channels and values you supply must be the same! Or only supply one value!\n\
-                     You supplied {chns} channels and {vals} values!")
-        size = len(chns)
+                     You supplied {list(chns)} channels and {vals} values!")
+        return_code = self.set_ch_param_function(self.caen,
+                                                self.slot,
+                                                plan.param,         #Parameter to write
+                                                plan.size,          #Number of channels you want to write (say 3)
+                                                plan.ch_list,       #Which specific channels you want to write (say 12, 5, and 8 in that order)
+                                                plan.values)        #The array of values for each channel you're writing to
+        if (return_code != 0):
+            self.check_return(return_code, f"Writing value {vals} for channels {list(chns)}, parameter {param} failed")
+
+    #Reading or writing a parameter for a set of channels always needs the same checks and the same C arrays
+    #So the first time a (parameter, channels) combination is used, it's checked against the parameter list and the arrays are made once
+    #After that every call reuses them. This means two calls can't be in flight at once on the same instance, which the test never does
+    def get_call_plan(self, direction, chns, param):
+        chns = tuple(chns)
         for ch in chns:
             if param not in self.ch_params[ch]:
                 sys.exit(f"{self.prefix} --> Tried to access parameter{param} which wasn't in the channel parameter list. Channel {ch} parameter list is {self.ch_params[ch]}")
             if (('Type' not in self.ch_params[ch][param]) or ('Mode' not in self.ch_params[ch][param])):
                 sys.exit(f"{self.prefix} --> Tried to access parameter{param} which didn't have Type and Mode set up in the channel parameter list. Channel {ch} parameter list is {self.ch_params[ch]}")
-            if (self.ch_params[ch][param]['Mode'] == self.PropertyMode.PARAM_MODE_WRONLY):
-                sys.exit(f"{self.prefix} --> Trying to read a parameter that is read only. Channel {ch} parameter list is {self.ch_params[ch]}")
-        if (self.ch_params[chns[0]][param]['Type'] == self.PropertyType.PARAM_TYPE_FLOAT.name):
-            c_param_val = (c_float * size)()
-        else:
-            c_param_val = (c_uint32 * size)()
-        if (len(vals) == 1):
-            c_param_val[:] = [vals[0]] * size       #This line is where every channel is set to the same value
+            if ((direction == "get") and (self.ch_params[ch][param]['Mode'] == self.PropertyMode.PARAM_MODE_WRONLY.name)):
+                sys.exit(f"{self.prefix} --> Trying to read a parameter that is write only. Channel {ch} parameter list is {self.ch_params[ch]}")
+            if ((direction == "set") and (self.ch_params[ch][param]['Mode'] == self.PropertyMode.PARAM_MODE_RDONLY.name)):
+                sys.exit(f"{self.prefix} --> Trying to write a parameter that is read only. Channel {ch} parameter list is {self.ch_params[ch]}")
+        plan = self.CallPlan(chns, param, self.ch_params[chns[0]][param]['Type'] == self.PropertyType.PARAM_TYPE_FLOAT.name)
+        #The parameter's dictionary entries, so the values can be filled in without looking them up each time
+        plan.entries = [self.ch_params[ch][param] for ch in chns]
+        self.call_plans[(direction, param, chns)] = plan
+        return plan
+
+    #Asks the library to send changes of the parameters for these channels as events, to the TCP port on this computer that's listening for them
+    #Returns True only if every parameter on every channel was accepted, the caller should go back to polling otherwise
+    def subscribe_channel_params(self, chns, params, port, subscribe = True):
+        if (subscribe):
+            function = self.libcaenhvwrapper.CAENHV_SubscribeChannelParams
         else:
-            for num,val in enumerate(vals):
-                c_param_val[num] = val
-        c_ch_list = (c_ushort * size)()
-        for num,ch in enumerate(chns):
-            c_ch_list[num] = ch
-        return_code = self.libcaenhvwrapper.CAENHV_SetChParam(self.caen,
-                                                            c_ushort(self.slot),
-                                                            param.encode('utf-8'),      #Parameter to write
-                                                            c_ushort(size),             #Number of channels you want to write (say 3)
-                                                            byref(c_ch_list),           #Which specific channels you want to write (say 12, 5, and 8 in that order)
-                                                            byref(c_param_val))         #The array of values for each channel you're writing to
-        self.check_return(return_code, f"Writing value {vals} for channels {chns}, parameter {param} failed")
+            function = self.libcaenhvwrapper.CAENHV_UnSubscribeChannelParams
+        param_list = ":".join(params).encode('utf-8')
+        c_result_codes = (c_char * len(params))()
+        for ch in chns:
+            return_code = function(self.caen, port, self.slot, ch, param_list, len(params), c_result_codes)
+            if ((return_code != 0) or any(i != b'\x00' for i in c_result_codes)):
+                print(f"{self.prefix} --> {'S' if subscribe else 'Uns'}ubscribing channel {ch} to {params} failed with error code {hex(return_code)}, result codes {list(c_result_codes.raw)}")
+                return False
+        return True
+
+    #Reads the events waiting on the socket the library connected to. Returns a list of (channel, parameter, value), or None if the read failed
+    #Item IDs are the board, channel and parameter separated by dots. Anything that isn't a channel parameter (like keep alives) is skipped
+    def get_event_data(self, sock):
+        c_system_status = self.SystemStatus()
+        c_event_data = POINTER(self.EventData)()
+        c_event_num = c_uint()
+        return_code = self.libcaenhvwrapper.CAENHV_GetEventData(sock, byref(c_system_status), byref(c_event_data), byref(c_event_num))
+        if (return_code != 0):
+            print(f"{self.prefix} --> Reading events failed with error code {hex(return_code)}")
+            return None
+        events = []
+        for i in range(c_event_num.value):
+            event = c_event_data[i]
+            if (event.Type != self.EventType.PARAMETER):
+                continue
+            fields = event.ItemID.decode('utf-8', 'replace').split(".")
+            if ((len(fields) < 2) or (not fields[-2].isdigit())):
+                continue
+            ch = int(fields[-2])
+            param = fields[-1]
+            if ((ch not in self.ch_params) or (param not in self.ch_params[ch])):
+                continue
+            if (self.ch_params[ch][param]['Type'] == self.PropertyType.PARAM_TYPE_FLOAT.name):
+                events.append((ch, param, event.Value.FloatValue))
+            else:
+                events.append((ch, param, event.Value.IntValue))
+        if (c_event_num.value):
+            self.libcaenhvwrapper.CAENHV_FreeEventData(byref(c_event_data))
+        return events
 
     #Simple class for checking error responses from the instrument and printing messages if applicable
     def check_return(self, ret, failmessage = None, passmessage = None):
@@ -541,6 +685,36 @@ class CAENR8033DM:
                 print(f"{self.prefix} --> {passmessage}")
             return 0
 
+    #The C arrays for one parameter on one set of channels
+    class CallPlan:
+        def __init__(self, chns, param, is_float):
+            self.chns = chns
+            self.size = len(chns)
+            self.param = param.encode('utf-8')
+            self.ch_list = (c_ushort * self.size)(*chns)
+            if (is_float):
+                self.values = (c_float * self.size)()
+            else:
+                self.values = (c_uint32 * self.size)()
+            self.entries = []
+
+    #Layouts of the event structures from CAENHVWrapper.h
+    class EventType(IntEnum):
+        PARAMETER = 0
+        ALARM = 1
+        KEEPALIVE = 2
+        TRMODE = 3
+
+    class EventValue(Union):
+        _fields_ = [("StringValue", c_char * 1024), ("FloatValue", c_float), ("IntValue", c_int)]
+
+    class EventData(Structure):
+        pass
+    EventData._fields_ = [("Type", c_int), ("ItemID", c_char * 20), ("Lenght", c_uint), ("Value", EventValue)]
+
+    class SystemStatus(Structure):
+        _fields_ = [("System", c_int), ("Board", c_int * 16)]
+
     #Enum classes of my reverse engineering what the enums must be in the C DLL
     class PropertyType(IntEnum):
         PARAM_TYPE_FLOAT = 0
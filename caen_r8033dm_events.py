@@ -0,0 +1,132 @@
+import socket
+import threading
+import time
+from collections import deque
+
+#Push mode telemetry. Instead of asking the crate for every value, the library is subscribed to the parameters of the channels,
+#and sends an event to a TCP port on this computer whenever one of them changes. A background thread reads the events as they come
+#and keeps the latest value of each (channel, parameter) along with a timestamped history
+#Since events only come when a value changes, the latest values are filled in with one poll before the events start
+#If the subscription isn't accepted, the library never connects or reading the events fails, alive goes False and the wrapper polls instead
+#A stream can also go quiet without the read ever failing. If nothing has come in for keepalive seconds, the check parameter is polled once
+#and compared with the pushed values. If they don't match, events were missed, so the stream is turned off and the wrapper polls from then on
+class CAENR8033DM_EVENTS:
+    def __init__(self, caen, channels, params, port = 0, keepalive = 5.0, check_param = "Status", connect_timeout = 2.0, history = 100000):
+        self.prefix = "CAEN R8033DM Events"
+        self.caen = caen
+        self.channels = list(channels)
+        self.params = list(params)
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self.check_param = check_param
+        self.last_heard = time.monotonic()      #When the library last sent anything, keep alives included, or the last check passed
+        self.lock = threading.Lock()
+        self.latest = {}                        #(channel, parameter) -> (time.time() of the event, value)
+        self.events = deque(maxlen = history)   #(time.time(), channel, parameter, value) for every event, oldest dropped first
+        self.event_count = 0
+        self.alive = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.connection = None
+        self.subscribed = False
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("", port))
+        self.server.listen(1)
+        self.server.settimeout(self.connect_timeout)
+        self.port = self.server.getsockname()[1]
+
+        for param in self.params:
+            values = self.poll(param)
+            now = time.time()
+            for ch, value in zip(self.channels, values):
+                self.latest[(ch, param)] = (now, value)
+
+        if (not self.caen.subscribe_channel_params(self.channels, self.params, self.port)):
+            self.fail("The crate didn't accept the subscription")
+            return
+        self.subscribed = True
+        self.thread = threading.Thread(target = self.run, name = "caen_events", daemon = True)
+        self.thread.start()
+        print(f"{self.prefix} --> Subscribed to {self.params} for channels {self.channels}, listening on port {self.port}")
+
+    def run(self):
+        try:
+            connection, address = self.server.accept()
+        except OSError as e:
+            self.fail(f"The library never connected to port {self.port} ({e})")
+            return
+        #Only from here on are the values kept up to date, until then the wrapper keeps polling
+        self.connection = connection
+        self.last_heard = time.monotonic()
+        self.alive = True
+        with connection:
+            while (not self.stop_event.is_set()):
+                events = self.caen.get_event_data(connection.fileno())
+                if (events is None):
+                    if (not self.stop_event.is_set()):
+                        self.fail("Reading events failed")
+                    return
+                self.last_heard = time.monotonic()
+                now = time.time()
+                with self.lock:
+                    for ch, param, value in events:
+                        self.latest[(ch, param)] = (now, value)
+                        self.events.append((now, ch, param, value))
+                    self.event_count += len(events)
+
+    def fail(self, reason):
+        self.alive = False
+        print(f"{self.prefix} --> {reason}, going back to polling the crate")
+
+    def poll(self, param):
+        values = self.caen.get_channel_parameter_value(self.channels, param, round_values = False)
+        if (len(self.channels) == 1):
+            return [values]
+        return values
+
+    #True if the events are still coming and cover these channels and this parameter
+    def covers(self, chns, param):
+        return self.alive and (param in self.params) and all(ch in self.channels for ch in chns) and self.check()
+
+    #After keepalive seconds without hearing from the library, checks the pushed values against the crate
+    #A ramp changes the status, so a stream that dropped while one was commanded is caught by the first check after it
+    def check(self):
+        if ((time.monotonic() - self.last_heard) < self.keepalive):
+            return True
+        polled = self.poll(self.check_param)
+        pushed = self.values(self.channels, self.check_param)
+        if (polled != pushed):
+            self.fail(f"No events for {self.keepalive} seconds and {self.check_param} is {polled} on the crate but {pushed} from the events")
+            self.close()
+            return False
+        self.last_heard = time.monotonic()
+        return True
+
+    #Latest value of the parameter for each channel, in the order asked for
+    def values(self, chns, param):
+        with self.lock:
+            return [self.latest[(ch, param)][1] for ch in chns]
+
+    #Every event since the given time.time(), for anything that wants more than the latest value
+    def events_since(self, start):
+        with self.lock:
+            return [i for i in self.events if i[0] >= start]
+
+    #Stops the subscription and the thread, whatever was pushed so far stays readable with events_since()
+    def close(self):
+        self.stop_event.set()
+        self.alive = False
+        if (self.subscribed):
+            self.caen.subscribe_channel_params(self.channels, self.params, self.port, subscribe = False)
+            self.subscribed = False
+        self.server.close()
+        #The thread may be waiting in the library for events that aren't coming, shutting the socket down lets the read return
+        if (self.connection is not None):
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if (self.thread is not None):
+            self.thread.join(timeout = self.connect_timeout)
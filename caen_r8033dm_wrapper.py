@@ -9,7 +9,10 @@ class CAENR8033DM_WRAPPER:
         self.json_data = json_data
         self.caen = CAENR8033DM(json_data)      #Creates instance of lower level which holds the connection
         self.rounding_factor = 2                #When comparing floats, we need to round
-        self.ramp_wait = 1.5                      #Time between checks when ramping up or down
+        self.ramp_wait = 1.5                      #Status isn't trusted to say a ramp is done until this long after it starts
+        self.ramp_poll_min = 0.2                #Shortest and longest time between checks when ramping up or down
+        self.ramp_poll_max = 1.5
+        self.ramp_tolerance = 1.0               #Volts from the target that count as there, when the status can't be trusted yet
         if (self.caen.caen.value == -1):
             sys.exit(f"{self.prefix} --> Device could not be intialized, returned {self.caen.caen.value}")
 
@@ -23,7 +26,8 @@ class CAENR8033DM_WRAPPER:
         if (self.get_board_status() != 0):
             sys.exit(f"{self.prefix} --> Board failed with error {hex(self.get_board_status())}")
 
-        channels = [0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,15]
+        self.channels = list(range(self.caen.num_of_channels))
+        channels = self.channels
         self.set_current_range(channels, self.json_data['caenR8033DM_current_range'])
         self.set_overcurrent(channels, self.json_data['caenR8033DM_overcurrent'])
         self.set_powerdown(channels, self.json_data['caenR8033DM_power_down_mode'])
@@ -32,6 +36,14 @@ class CAENR8033DM_WRAPPER:
         self.set_trip_time(channels, self.json_data['caenR8033DM_trip_time'])
         self.set_HV_value(channels, self.json_data['caenR8033DM_term_voltage'])
 
+        #With events on, the monitors and status are pushed by the crate as they change instead of being polled, see caen_r8033dm_events.py
+        #get_values() uses them while they're coming in, and polls if the subscription failed or stops
+        #Only tried against a stand-in for the library so far, so it's off by default
+        self.events = None
+        if (self.json_data['caenR8033DM_events'] == "True"):
+            from caen_r8033dm_events import CAENR8033DM_EVENTS
+            self.events = CAENR8033DM_EVENTS(self.caen, self.channels, ["VMon", "IMon", "Status"], self.json_data['caenR8033DM_event_port'], self.json_data['caenR8033DM_event_keepalive'])
+
         # print(self.get_channel_status(3))
         # print(self.get_channel_status([3,4,5,6, 7]))
 
@@ -61,14 +73,23 @@ class CAENR8033DM_WRAPPER:
         self.power_cycle(ch, False)
 
     def power_cycle(self, ch, up):
+        value = self.start_power(ch, up)
+        if (not isinstance(ch, list)):
+            ch = [ch]
+        self.wait_for_ramps(ch, value, up)
+
+    #Checks the channels for errors and sets them to turn on or off, but doesn't wait for the ramp
+    #Returns the status value the channels will have once they're done ramping
+    def start_power(self, ch, up):
         if (up):
             value = 1
         else:
             value = 0
-        status = self.get_channel_status(ch)
-        #Make it work for both single channels and lists
+        #Make it work for both single channels and lists, a list of one channel gets a single value back
         if (not isinstance(ch, list)):
             ch = [ch]
+        status = self.get_channel_status(ch)
+        if (len(ch) == 1):
             status = [status]
         #Check if there's any error in the channels before the power is touched
         for num,i in enumerate(ch):
@@ -76,35 +97,99 @@ class CAENR8033DM_WRAPPER:
                 self.channel_error(i, status[num])
         #Set all the channels to turn on or off
         self.caen.set_ch_parameter(ch, "Pw", value)
-        #Need the device status to update, sometimes it says it's completed before it starts
-        time.sleep(self.ramp_wait)
-        #If any channels are ramping, wait for ramping to finish
-        for num,i in enumerate(ch):
-            self.get_power_status(ch[num])
-            if (self.get_channel_status(ch[num]) != value):
-                self.wait_for_ramp(ch[num], up)
-
-    #Monitor the ramping of the power, while checking to see if channel status throws and error
-    def wait_for_ramp(self, ch, going_up):
+        return value
+
+    #Monitor the ramping of all the channels at once, while checking to see if channel status throws an error
+    #Every check is one read of Status and one of VMon for all the channels. The ramp rate and the distance left give the time until the
+    #slowest channel should be done, and the next check is then, kept between ramp_poll_min and ramp_poll_max
+    #Returns as soon as every channel has the status it should end up with
+    def wait_for_ramps(self, ch, value, going_up):
+        if (going_up):
+            targets = self.get_values(ch, "VSet")
+            rates = self.get_values(ch, "RUp")
+        else:
+            targets = [0] * len(ch)
+            rates = self.get_values(ch, "RDwn")
+        start = time.monotonic()
         while(True):
-            #print(self.get_channel_status(ch))
-            #print(self.caen.get_channel_parameter_value(ch, "Pw"))
+            status = self.get_values(ch, "Status")
+            voltages = self.get_values(ch, "VMon")
+            for num,i in enumerate(ch):
+                if (status[num] > 0x7):
+                    self.channel_error(i, status[num])
+            elapsed = time.monotonic() - start
+            ramping = [num for num in range(len(ch)) if not self.ramp_done(status[num], voltages[num], targets[num], value, elapsed)]
+            if (not ramping):
+                break
+            remaining = max(abs(targets[num] - voltages[num]) / rates[num] if rates[num] > 0 else self.ramp_poll_max for num in ramping)
             if (going_up):
-                if (self.get_channel_status(ch) == 1):
-                    break
-                print(f"{self.prefix} --> Channel {ch} is ramping up to {self.get_HV_value(ch)}, currently at {self.get_voltage(ch)}")
+                print(f"{self.prefix} --> Channels {[ch[num] for num in ramping]} are ramping up to {[targets[num] for num in ramping]}, currently at {[round(voltages[num], self.rounding_factor) for num in ramping]}, about {round(remaining, 1)} seconds left")
             else:
-                if (self.get_channel_status(ch) == 0):
-                    break
-                print(f"{self.prefix} --> Channel {ch} is ramping down to turn off, currently at {self.get_voltage(ch)}")
-            time.sleep(self.ramp_wait)
-            if (self.get_channel_status(ch) > 0x7):
-                self.channel_error(ch, self.get_channel_status(ch))
+                print(f"{self.prefix} --> Channels {[ch[num] for num in ramping]} are ramping down to turn off, currently at {[round(voltages[num], self.rounding_factor) for num in ramping]}, about {round(remaining, 1)} seconds left")
+            time.sleep(min(max(remaining, self.ramp_poll_min), self.ramp_poll_max))
+
+    #A channel is done ramping when its status says so. Right after the power is set, the status sometimes says it's completed before it starts,
+    #so until ramp_wait has gone by the voltage has to be at the target too
+    def ramp_done(self, status, voltage, target, value, elapsed):
+        if (status != value):
+            return False
+        return (elapsed >= self.ramp_wait) or (abs(voltage - target) <= self.ramp_tolerance)
+
+    #Reads a parameter for a list of channels and always gives back a list, even for one channel
+    #If the parameter is being pushed as events, the latest values are returned without asking the crate
+    def get_values(self, ch, param):
+        if ((self.events is not None) and self.events.covers(ch, param)):
+            return self.events.values(ch, param)
+        values = self.caen.get_channel_parameter_value(ch, param, round_values = False)
+        if (len(ch) == 1):
+            return [values]
+        return values
 
     #These functions basically get and set different parameters of each channel, with a variable amount of channels as the input
     def get_voltage(self, ch):
         return self.caen.get_channel_parameter_value(ch, "VMon")
 
+    #Snapshot of VMon and IMon for a list of channels (all of them by default)
+    #This is 2 CAENHV_GetChParam calls in total instead of 2 per channel, which matters when sampling all 16 channels every second
+    #With events on, it's no calls at all
+    #Returns a list of voltages and a list of currents in the same order as the channels asked for
+    def get_monitors(self, ch = None):
+        if (ch is None):
+            ch = self.channels
+        if (not isinstance(ch, list)):
+            ch = [ch]
+        return self.get_values(ch, "VMon"), self.get_values(ch, "IMon")
+
+    #With events on, the VMon and IMon changes pushed from start up to end (both time.time()) for the channels asked for
+    #Returns rows of (time.time(), voltages, currents), each with every channel's values as they stood right after that event,
+    #starting from the voltages and currents given. Events that came in together make one row
+    def get_monitor_events(self, start, end, voltages, currents, ch = None):
+        if (self.events is None):
+            return []
+        if (ch is None):
+            ch = self.channels
+        index = {c: num for num, c in enumerate(ch)}
+        voltages = list(voltages)
+        currents = list(currents)
+        rows = []
+        for t, c, param, value in self.events.events_since(start):
+            if ((t >= end) or (c not in index) or (param not in ["VMon", "IMon"])):
+                continue
+            if (param == "VMon"):
+                voltages[index[c]] = value
+            else:
+                currents[index[c]] = value
+            if (rows and (rows[-1][0] == t)):
+                rows.pop()
+            rows.append((t, list(voltages), list(currents)))
+        return rows
+
+    #Turns off the event stream so the library stops sending to this computer, call it before the script ends
+    def close(self):
+        if (self.events is not None):
+            self.events.close()
+            self.events = None
+
     def set_HV_value(self, ch, voltage):
         self.caen.set_ch_parameter(ch, "VSet", voltage)
         return self.get_check_channel_parameter(ch, "VSet", voltage)
@@ -169,6 +254,11 @@ class CAENR8033DM_WRAPPER:
     #Or multiple channels and 1 value, or multiple channels and values
     def get_check_channel_parameter(self, ch, param, value):
         resp = self.caen.get_channel_parameter_value(ch, param)
+        #A list of one channel reads back a single value
+        if (isinstance(ch, list) and len(ch) == 1):
+            ch = ch[0]
+            if (isinstance(value, list)):
+                value = value[0]
         if (isinstance(ch, list) and not isinstance(value, list)):
             for num in range(len(ch)):
                 if (round(resp[num],self.rounding_factor) != value):
@@ -0,0 +1,45 @@
+import sys
+import subprocess
+
+#Checks how long it takes to import the test scripts, and that the heavy analysis and plotting packages aren't pulled in at startup
+#They should only be loaded when a fit or plot is first needed, see the note at the top of dune_hv_crate_test.py
+#Run like:
+#python3 check_import_time.py
+#or with a budget in seconds other than the default:
+#python3 check_import_time.py 0.5
+modules = ["dune_hv_crate_test", "hv_crate_characterization"]
+#numpy isn't on this list because pyvisa imports it itself when it's installed
+heavy = ["matplotlib", "scipy", "openpyxl"]
+default_budget = 1.0
+
+def check_module(module, budget):
+    #-X importtime writes a line per import to stderr, "import time: self [us] | cumulative | imported package"
+    code = f"import sys, {module}; print(','.join(sorted(set(m.split('.')[0] for m in sys.modules))))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if (result.returncode != 0):
+        print(f"{module} --> Could not be imported:\n{result.stderr}")
+        return False
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if (len(fields) == 3 and fields[2].strip() == module):
+            cumulative = int(fields[1]) / 1E6
+    loaded = result.stdout.strip().split(",")
+    passed = True
+    if (cumulative > budget):
+        print(f"{module} --> FAIL: Took {round(cumulative, 3)} seconds to import, the budget is {budget} seconds")
+        passed = False
+    else:
+        print(f"{module} --> Took {round(cumulative, 3)} seconds to import, the budget is {budget} seconds")
+    for i in heavy:
+        if (i in loaded):
+            print(f"{module} --> FAIL: {i} was imported at startup")
+            passed = False
+    return passed
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else default_budget
+    results = [check_module(i, budget) for i in modules]
+    if (not all(results)):
+        sys.exit("Import time check failed")
+    print("Import time check passed")
@@ -3,48 +3,53 @@ import sys
 import json
 import os
 import time
-import openpyxl
+import math
 from datetime import datetime
 from keysight_daq970a import Keysight970A
 from rigol_dp832a import RigolDP832A
 from caen_r8033dm_wrapper import CAENR8033DM_WRAPPER
+from hv_sampler import HVSampler
+from hv_plot import PlotPool
+from station_scheduler import StationScheduler
 
-import csv
 from pathlib import Path
-import matplotlib.dates as mdates
-import matplotlib.ticker as mticker
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MultipleLocator
-import numpy as np
-from scipy.optimize import curve_fit
+#openpyxl and the numpy based hv_trace and hv_fit are imported where they're first used rather than up here
+#Operators restart this script a lot (a loose cable means starting over), so startup should only pay for what the instruments need
+#Run check_import_time.py after changing imports to make sure nothing heavy sneaks back in
 
 class LDOmeasure:
     def __init__(self, config_file = None, name = None):
         self.prefix = "DUNE HV Crate Tester"
         print(f"{self.prefix} --> Welcome to the DUNE HV crate production testing script")
+        #Without a config (like when just_plot uses this class), plots are drawn right away
+        self.plot_pool = PlotPool(0)
         if not config_file:
             print(f"{self.prefix} --> No config file given, test will not run")
             return
         with open(config_file, "r") as jsonfile:
             self.json_data = json.load(jsonfile)
+        self.plot_pool = PlotPool(self.json_data['plot_workers'])
         self.rm = pyvisa.ResourceManager('@py')
 
         #Initialize all instruments first so that you don't waste time with input if something is not connected
         self.c = CAENR8033DM_WRAPPER(self.json_data)
+        #The CAEN event stream is turned off however the test ends, including the sys.exit() calls along the way
+        try:
+            self.sequence(name)
+        finally:
+            self.c.close()
+
+    def sequence(self, name):
         self.k = Keysight970A(self.rm, self.json_data)
 
         #Since there are 2 Rigols, set them up here so they know what channels they have
         #And if the test sequence calls the wrong one, it'll throw an error
+        #Each one's channels are set up in a single transaction
         self.r0 = RigolDP832A(self.rm, self.json_data, 0)
-        self.r0.setup_fan()
-        self.r0.setup_heater_supply()
-        self.r0.setup_heater_switch()
+        self.r0.setup_channels(["fan", "heat_supply", "heat_switch"])
 
         self.r1 = RigolDP832A(self.rm, self.json_data, 1)
-        self.r1.setup_hvpullup()
-        self.r1.setup_hvpullup2()
-        self.r1.setup_fanread()
+        self.r1.setup_channels(["hvpullup", "hvpullup2", "fanread"])
         #Now we can get the input for the name of the test
         if (name):
             self.test_name = name
@@ -66,12 +71,26 @@ class LDOmeasure:
         self.hv_test_result = True
 
         self.datastore['Tests'] = {}
-
-        self.fan_test()
-        self.wb.save(self.path_to_spreadsheet)
-        self.heater_test()
+        self.datastore['hv_sampling'] = {}
+
+        #Each instrument has a lock, and the Keysight is only ever configured and read while holding it
+        self.station = StationScheduler(["keysight", "rigol0", "rigol1"])
+        self.station_tasks = None
+        #The fan and heater tests can also be left for the first HV soak, when the Keysight and Rigols would otherwise sit idle
+        if (self.json_data['station_during_hv'] != "True"):
+            self.station_tests()
+            self.wb.save(self.path_to_spreadsheet)
+        try:
+            self.hv_test()
+        except BaseException:
+            #Whatever ended the HV test, the fan and heater tests can't be left running in the background with the supplies on
+            self.stop_station_tests()
+            raise
+        self.finish_station_tests()
+        self.station.close()
         self.wb.save(self.path_to_spreadsheet)
-        self.hv_test()
+        #The HV plots were queued as each phase finished, make sure they're all written before wrapping up
+        self.plot_pool.wait()
 
         if (self.fan_test_result and self.heat_test_result and self.hv_test_result):
             self.ws.cell(row=self.row, column=1, value=self.test_name).style = "pass"
@@ -91,11 +110,11 @@ class LDOmeasure:
 
         print(f"{self.prefix} --> Test complete")
         self.beep_sequence()
-        #self.make_hv_plots()
 
     #Looks to see if a main spreadsheet of all results exists. If it does, open it and find the next row to write these results to
     #If not, it creates the spreadsheet with the proper headers and formatting
     def initialize_spreadsheet(self):
+        import openpyxl
         #In the config JSON I give the user the ability to choose the absolute path to dump all this stuff into, or make it relative to this Python script
         if (self.json_data["relative"] == "True"):
             output_path = os.path.abspath(self.json_data["output_directory"])
@@ -186,50 +205,99 @@ class LDOmeasure:
         self.ws.cell(row=self.row, column=3, value=datetime.today().strftime('%I:%M:%S %p'))
         self.wb.save(self.path_to_spreadsheet)
 
+    #The fan and heater tests use different Rigol channels, so they can run at the same time and their waits overlap
+    def station_tests(self):
+        if (self.json_data['station_concurrent'] == "True"):
+            self.station.run([("fan_test", self.fan_test), ("heater_test", self.heater_test)])
+        else:
+            self.fan_test()
+            with self.station.workbook:
+                self.wb.save(self.path_to_spreadsheet)
+            self.heater_test()
+
+    #Called when each HV soak starts. The first time, the fan and heater tests are started in the background if they were left for the HV test
+    #The HV side only needs the Keysight to switch relays between soaks, and the CAEN sampling doesn't touch these instruments at all
+    def start_station_tests(self):
+        if ((self.json_data['station_during_hv'] == "True") and (self.station_tasks is None)):
+            print(f"{self.prefix} --> Running the fan and heater tests during the HV soak")
+            self.station_tasks = self.station.start([("station_tests", self.station_tests)])
+
+    #Waits for the fan and heater tests if they ran during the HV test, or runs them now if the HV test never got to a soak
+    def finish_station_tests(self):
+        if (self.json_data['station_during_hv'] != "True"):
+            return
+        if (self.station_tasks is None):
+            self.station_tests()
+        else:
+            self.station.join(self.station_tasks)
+
+    #Stops the fan and heater tests if they're running in the background, waits for them and turns every Rigol output off
+    def stop_station_tests(self):
+        if (self.station_tasks is not None):
+            print(f"{self.prefix} --> Stopping the fan and heater tests")
+            self.station.stop()
+            for i in self.station_tasks:
+                i.join()
+        with self.station.lock("rigol0"):
+            for i in self.r0.channels:
+                self.r0.power("OFF", i)
+        with self.station.lock("rigol1"):
+            for i in self.r1.channels:
+                self.r1.power("OFF", i)
+
     def fan_test(self):
         #Fan test
-        self.k.initialize_fan()
-        self.r0.power("ON", "fan")
-        self.r1.power("ON", "fanread")
-        print(f"{self.prefix} --> Fans turned on, waiting {self.json_data['fan_wait']} seconds for the fans to reach steady state...")
-        time.sleep(self.json_data['fan_wait'])
-        fan_voltage = self.r0.get_voltage("fan")
-        fan_current = self.r0.get_current("fan")
-        fanread_voltage = self.r1.get_voltage("fanread")
-        fanread_current = self.r1.get_current("fanread")
-        fan_read_signal = self.k.measure_fan()
-        self.r0.power("OFF", "fan")
-        self.r1.power("OFF", "fanread")
+        #The two Rigols and the Keysight are separate instruments, so they're all asked at the same time
+        #The heater test may have the Keysight set up for something else in the meantime, so it's configured right before reading
+        def read_fan_signal():
+            self.k.initialize_fan()
+            return self.k.measure_fan()
+        try:
+            self.station.gather(("rigol0", self.r0.power, "ON", "fan"), ("rigol1", self.r1.power, "ON", "fanread"))
+            print(f"{self.prefix} --> Fans turned on, waiting {self.json_data['fan_wait']} seconds for the fans to reach steady state...")
+            self.station.sleep(self.json_data['fan_wait'])
+            fan_supply, fanread_supply, fan_read_signal = self.station.gather(("rigol0", self.r0.read_all, ["fan"]), ("rigol1", self.r1.read_all, ["fanread"]), ("keysight", read_fan_signal))
+            fan_supply = fan_supply["fan"]
+            fanread_supply = fanread_supply["fanread"]
+            self.station.gather(("rigol0", self.r0.power, "OFF", "fan"), ("rigol1", self.r1.power, "OFF", "fanread"))
+        finally:
+            #Even if this test stopped partway, the heater shouldn't be left waiting on it forever
+            self.station.signal("fans_off")
+        fan_voltage = fan_supply["voltage"]
+        fan_current = fan_supply["current"]
+        fanread_voltage = fanread_supply["voltage"]
+        fanread_current = fanread_supply["current"]
         print(f"{self.prefix} --> Fans turned off")
         print(f"{self.prefix} --> Fan power supply was {fan_voltage}V and {fan_current}A")
         print(f"{self.prefix} --> Read signal for each fan was {fan_read_signal}")
         print(f"{self.prefix} --> Fan read pullup supply was {fanread_voltage}V and {fanread_current}A")
 
-        self.fan_test_result = True
-        if ((fan_voltage < self.json_data["fan_voltage_max"]) and (fan_voltage > self.json_data["fan_voltage_min"])):
-            self.ws.cell(row=self.row, column=4, value=fan_voltage)
-            self.datastore['Tests']['fan_voltage_test'] = "Pass"
-        else:
-            self.ws.cell(row=self.row, column=4, value=fan_voltage).style = "fail"
-            self.datastore['Tests']['fan_voltage_test'] = "Fail"
-            self.fan_test_result = False
+        with self.station.workbook:
+            self.fan_test_result = True
+            if ((fan_voltage < self.json_data["fan_voltage_max"]) and (fan_voltage > self.json_data["fan_voltage_min"])):
+                self.ws.cell(row=self.row, column=4, value=fan_voltage)
+                self.datastore['Tests']['fan_voltage_test'] = "Pass"
+            else:
+                self.ws.cell(row=self.row, column=4, value=fan_voltage).style = "fail"
+                self.datastore['Tests']['fan_voltage_test'] = "Fail"
+                self.fan_test_result = False
 
-        if ((fan_current < self.json_data["fan_current_max"]) and (fan_current > self.json_data["fan_current_min"])):
-            self.ws.cell(row=self.row, column=5, value=fan_current)
-            self.datastore['Tests']['fan_current_test'] = "Pass"
-        else:
-            self.ws.cell(row=self.row, column=5, value=fan_current).style = "fail"
-            self.datastore['Tests']['fan_current_test'] = "Fail"
-            self.fan_test_result = False
-
-        for i in range(1,5):
-            if ((fan_read_signal[i] < self.json_data["fan_read_max"]) and (fan_read_signal[i] > self.json_data["fan_read_min"])):
-                self.ws.cell(row=self.row, column=5+i, value=round(fan_read_signal[i], self.rounding_factor))
-                self.datastore['Tests'][f'fan_signal_test_{i}'] = "Pass"
+            if ((fan_current < self.json_data["fan_current_max"]) and (fan_current > self.json_data["fan_current_min"])):
+                self.ws.cell(row=self.row, column=5, value=fan_current)
+                self.datastore['Tests']['fan_current_test'] = "Pass"
             else:
-                self.ws.cell(row=self.row, column=5+i, value=round(fan_read_signal[i], self.rounding_factor)).style = "fail"
+                self.ws.cell(row=self.row, column=5, value=fan_current).style = "fail"
+                self.datastore['Tests']['fan_current_test'] = "Fail"
                 self.fan_test_result = False
 
+            for i in range(1,5):
+                if ((fan_read_signal[i] < self.json_data["fan_read_max"]) and (fan_read_signal[i] > self.json_data["fan_read_min"])):
+                    self.ws.cell(row=self.row, column=5+i, value=round(fan_read_signal[i], self.rounding_factor))
+                    self.datastore['Tests'][f'fan_signal_test_{i}'] = "Pass"
+                else:
+                    self.ws.cell(row=self.row, column=5+i, value=round(fan_read_signal[i], self.rounding_factor)).style = "fail"
+                    self.fan_test_result = False
+
         self.datastore['fan_voltage'] = fan_voltage
         self.datastore['fan_current'] = fan_current
         self.datastore['fanread_voltage'] = fanread_voltage
@@ -239,56 +307,71 @@ class LDOmeasure:
     def heater_test(self):
         #Heater test
         #First measure resistance of heating element with no power connected
-        self.k.initialize_resistance()
-        heater_resistance = self.k.measure_resistance()
+        #The starting temperatures come from the same scan, the RTD and heater channels can share the scan list
+        with self.station.lock("keysight"):
+            self.k.initialize_scan(["resistance", "rtd"])
+            readings = self.k.measure()
+        heater_resistance = readings["resistance"]
+        temp1 = readings["rtd"]
         print(f"{self.prefix} --> Heating element resistances are {heater_resistance}")
 
-        self.heat_test_result = True
-        for i in range(1,5):
-            if ((heater_resistance[i] < self.json_data["heating_element_max"]) and (heater_resistance[i] > self.json_data["heating_element_min"])):
-                self.ws.cell(row=self.row, column=9+i, value=round(heater_resistance[i], self.rounding_factor))
-                self.datastore['Tests'][f'heating_element_test_{i}'] = "Pass"
-            else:
-                self.ws.cell(row=self.row, column=9+i, value=round(heater_resistance[i], self.rounding_factor)).style = "fail"
-                self.datastore['Tests'][f'heating_element_test_{i}'] = "Fail"
-                self.heat_test_result = False
+        with self.station.workbook:
+            self.heat_test_result = True
+            for i in range(1,5):
+                if ((heater_resistance[i] < self.json_data["heating_element_max"]) and (heater_resistance[i] > self.json_data["heating_element_min"])):
+                    self.ws.cell(row=self.row, column=9+i, value=round(heater_resistance[i], self.rounding_factor))
+                    self.datastore['Tests'][f'heating_element_test_{i}'] = "Pass"
+                else:
+                    self.ws.cell(row=self.row, column=9+i, value=round(heater_resistance[i], self.rounding_factor)).style = "fail"
+                    self.datastore['Tests'][f'heating_element_test_{i}'] = "Fail"
+                    self.heat_test_result = False
 
         self.datastore['heater_resistance'] = heater_resistance
 
-        #Then prepare RTD and switch relay to connect power
-        self.k.initialize_rtd()
-        temp1 = self.k.measure_rtd()
-        self.r0.power("ON", "heat_supply")
-        self.r0.power("ON", "heat_switch")
-        print(f"{self.prefix} --> Heat turned on, waiting {self.json_data['heat_wait']} seconds for the sensors to heat up...")
-        time.sleep(self.json_data['heat_wait'])
-        supply_voltage = self.r0.get_voltage("heat_supply")
-        supply_current = self.r0.get_current("heat_supply")
-        switch_voltage = self.r0.get_voltage("heat_switch")
-        switch_current = self.r0.get_current("heat_switch")
-        temp2 = self.k.measure_rtd()
+        #Running fans cool the board, so if the heat rise limits were set with the fans off, wait for the fan test to finish first
+        #and take the starting temperatures again once they're off
+        if (self.json_data['heat_after_fans'] == "True"):
+            self.station.wait_for("fans_off")
+            with self.station.lock("keysight"):
+                self.k.initialize_rtd()
+                temp1 = self.k.measure_rtd()
+
+        #Then switch relay to connect power
+        with self.station.lock("rigol0"):
+            self.r0.power("ON", "heat_supply")
+            self.r0.power("ON", "heat_switch")
+        print(f"{self.prefix} --> Heat turned on, watching the sensors heat up for up to {self.json_data['heat_wait']} seconds...")
+        temp2, heat_series = self.record_heat(temp1)
+        with self.station.lock("rigol0"):
+            heat_supplies = self.r0.read_all(["heat_supply", "heat_switch"])
+        supply_voltage = heat_supplies["heat_supply"]["voltage"]
+        supply_current = heat_supplies["heat_supply"]["current"]
+        switch_voltage = heat_supplies["heat_switch"]["voltage"]
+        switch_current = heat_supplies["heat_switch"]["current"]
         temp_rise = []
         temp_rise.append(temp2[1] - temp1[1])
         temp_rise.append(temp2[2] - temp1[2])
         temp_rise.append(temp2[3] - temp1[3])
         temp_rise.append(temp2[4] - temp1[4])
 
-        self.r0.power("OFF", "heat_supply")
-        self.r0.power("OFF", "heat_switch")
+        with self.station.lock("rigol0"):
+            self.r0.power("OFF", "heat_supply")
+            self.r0.power("OFF", "heat_switch")
         print(f"{self.prefix} --> Heat turned off")
         print(f"{self.prefix} --> Heat power supply was {supply_voltage}V and {supply_current}A")
         print(f"{self.prefix} --> Heat power switch was {switch_voltage}V and {switch_current}A")
         print(f"{self.prefix} --> Original temperatures were {temp1}")
-        print(f"{self.prefix} --> Temperatures after {self.json_data['heat_wait']} seconds were {temp2}, a rise of {temp_rise}")
+        print(f"{self.prefix} --> Temperatures after {heat_series['heated_seconds']} seconds were {temp2}, a rise of {temp_rise}")
 
-        for i in range(4):
-            if ((temp_rise[i] < self.json_data["temp_increase_max"]) and (temp_rise[i] > self.json_data["temp_increase_min"])):
-                self.ws.cell(row=self.row, column=14+i, value=round(temp_rise[i], self.rounding_factor))
-                self.datastore['Tests'][f'temperature_rise_test_{i}'] = "Pass"
-            else:
-                self.ws.cell(row=self.row, column=14+i, value=round(temp_rise[i], self.rounding_factor)).style = "fail"
-                self.datastore['Tests'][f'temperature_rise_test_{i}'] = "Fail"
-                self.heat_test_result = False
+        with self.station.workbook:
+            for i in range(4):
+                if ((temp_rise[i] < self.json_data["temp_increase_max"]) and (temp_rise[i] > self.json_data["temp_increase_min"])):
+                    self.ws.cell(row=self.row, column=14+i, value=round(temp_rise[i], self.rounding_factor))
+                    self.datastore['Tests'][f'temperature_rise_test_{i}'] = "Pass"
+                else:
+                    self.ws.cell(row=self.row, column=14+i, value=round(temp_rise[i], self.rounding_factor)).style = "fail"
+                    self.datastore['Tests'][f'temperature_rise_test_{i}'] = "Fail"
+                    self.heat_test_result = False
 
         self.datastore['heater_supply_voltage'] = supply_voltage
         self.datastore['heater_supply_current'] = supply_current
@@ -298,342 +381,339 @@ class LDOmeasure:
         self.datastore['temp1'] = temp1
         self.datastore['temp2'] = temp2
         self.datastore['temp_rise'] = temp_rise
+        self.datastore['heat_series'] = heat_series
+
+    #Scans the RTDs over and over while the heat is on instead of reading them once at the end, and keeps every scan
+    #With heat_early_stop, the heat goes off as soon as every RTD has risen past temp_increase_min, or any RTD has gone past temp_increase_max,
+    #for heat_early_stop_readings scans in a row so one noisy reading can't decide it. Otherwise it heats for the full heat_wait like before
+    #The Keysight is only held for each scan, so the fan test can use it in between
+    def record_heat(self, temp1):
+        heat_wait = self.json_data['heat_wait']
+        interval = self.json_data['heat_rtd_interval']
+        early_stop = (self.json_data['heat_early_stop'] == "True")
+        readings = self.json_data['heat_early_stop_readings']
+        passed = 0
+        over = 0
+        heat_series = {"seconds": [], "temps": [], "stop_reason": "heat_wait"}
+        start = time.monotonic()
+        while (True):
+            scan_start = time.monotonic()
+            with self.station.lock("keysight"):
+                #Only the RTDs are scanned while the heat is on, a resistance reading on the powered elements would be meaningless
+                if (self.k.state != ("rtd",)):
+                    self.k.initialize_rtd()
+                temps = self.k.measure_rtd()
+            elapsed = time.monotonic() - start
+            heat_series['seconds'].append(round(elapsed, 3))
+            heat_series['temps'].append(temps)
+            rise = [temps[i] - temp1[i] for i in range(1,5)]
+            passed = passed + 1 if (min(rise) > self.json_data["temp_increase_min"]) else 0
+            over = over + 1 if (max(rise) > self.json_data["temp_increase_max"]) else 0
+            if (early_stop and (over >= readings)):
+                heat_series['stop_reason'] = "over_max"
+                break
+            if (early_stop and (passed >= readings)):
+                heat_series['stop_reason'] = "passed_min"
+                break
+            if (elapsed >= heat_wait):
+                break
+            self.station.sleep(max(0, min(interval - (time.monotonic() - scan_start), heat_wait - elapsed)))
+        heat_series['heated_seconds'] = round(elapsed, 3)
+        heat_series['seconds_saved'] = round(max(0, heat_wait - elapsed), 3)
+        if (heat_series['stop_reason'] != "heat_wait"):
+            print(f"{self.prefix} --> Heat rise was decided ({heat_series['stop_reason']}) after {round(elapsed, 1)} of {heat_wait} seconds")
+        return temps, heat_series
 
     def hv_test(self):
         #HV Leakage Test
         hv_results = {}
-        self.r1.power("ON", "hvpullup")
-        self.r1.power("ON", "hvpullup2")
+        with self.station.lock("rigol1"):
+            self.r1.power("ON", "hvpullup")
+            self.r1.power("ON", "hvpullup2")
         self.hv_test_result = True
-        for i in self.json_data['channels_to_test']:
-            pos_ch = self.json_data[f"pcb_ch_{i}_pos"]
-            neg_ch = self.json_data[f"pcb_ch_{i}_neg"]
+        #PCB channels are tested in groups that share each soak. Every PCB channel has its own pair of CAEN channels and relay bits,
+        #and record_hv_data already samples all 16 CAEN channels, so each channel's fit and plot come out of the group's capture
+        #Set hv_group_size to 1 to test one channel at a time
+        channels = self.json_data['channels_to_test']
+        group_size = max(1, self.json_data['hv_group_size'])
+        groups = [channels[start:start + group_size] for start in range(0, len(channels), group_size)]
+        phases = [("pos", False), ("pos", True), ("neg", False), ("neg", True)]
+        for i in channels:
             hv_results[i] = {}
+        #With the pipeline, the groups run side by side so one group's ramps happen during another's soaks, see hv_pipeline.py
+        if (self.json_data['hv_pipeline'] == "True"):
+            from hv_pipeline import HVPipeline
+            HVPipeline(self).run(groups, phases, hv_results)
+        else:
+            for group in groups:
+                print(f"{self.prefix} --> Testing HV for channels {group}")
+                for polarity, term in phases:
+                    self.hv_phase(group, polarity, term, hv_results)
 
-            #Measure the ramp from 0 to positive voltage with open termination
-            v = self.json_data['caenR8033DM_open_voltage']
-            self.c.set_HV_value(pos_ch, v)
-            print(f"{self.prefix} --> Turning Channel {pos_ch} HV from 0 to {v}V with open termination")
-            self.k.set_relay(0, 1 << i)
-            self.c.turn_on(pos_ch)
-            print(f"{self.prefix} --> HV reached max value, waiting {self.json_data['hv_stability_wait']} seconds to stabilize...")
-            time.sleep(self.json_data['hv_stability_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_pos_open_on.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, pos_ch, on = True, term = False)
-            hv_results[i]["pos_open_on_fit"] = fit
-            hv_results[i]["pos_open_V"] = self.c.get_voltage(pos_ch)
-            hv_results[i]["pos_open_I"] = self.c.get_current(pos_ch)
-            self.make_plot(csv_name, f"0 to {v}V, open termination", pos_ch, fit[0][1], [v-5, v+5])
-
-            #Measure the ramp from positive voltage to 0 with open termination
-            print(f"{self.prefix} --> Turning Channel {pos_ch} HV from {v}V to 0 with open termination")
-            self.c.turn_off(pos_ch)
-            # print(f"{self.prefix} --> HV turned off, waiting {self.json_data['hv_stability_wait']} seconds to stabilize...")
-            # time.sleep(self.json_data['hv_stability_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_pos_open_off.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, pos_ch, on = False, term = False)
-            hv_results[i]["pos_open_off_fit"] = fit
-            self.make_plot(csv_name, f"{v} to 0V, open termination", pos_ch, fit[0][1])
-
-            #Measure the ramp from 0 to positive voltage with 10k termination
-            v = self.json_data['caenR8033DM_term_voltage']
-            self.c.set_HV_value(pos_ch, v)
-            print(f"{self.prefix} --> Turning Channel {pos_ch} HV from 0 to {v}V with 10k termination")
-            self.k.set_relay(0, 0)
-            self.c.turn_on(pos_ch)
-            print(f"{self.prefix} --> HV reached max value, waiting {self.json_data['hv_termination_wait']} seconds to stabilize...")
-            time.sleep(self.json_data['hv_termination_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_pos_term_on.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, pos_ch, on = True, term = True)
-            hv_results[i]["pos_term_on_fit"] = fit
-            hv_results[i]["pos_term_V"] = self.c.get_voltage(pos_ch)
-            hv_results[i]["pos_term_I"] = self.c.get_current(pos_ch)
-            self.make_plot(csv_name, f"0 to {v}V, termination resistor", pos_ch, fit[0][1], [v-5, v+5])
-
-            #Measure the ramp from positive voltage to 0 with 10k termination
-            print(f"{self.prefix} --> Turning Channel {pos_ch} HV from {v}V to 0 with 10k termination")
-            self.c.turn_off(pos_ch)
-            # print(f"{self.prefix} --> HV turned off, waiting {self.json_data['hv_stability_wait']} seconds to stabilize...")
-            # time.sleep(self.json_data['hv_stability_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_pos_term_off.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, pos_ch, on = False, term = True)
-            hv_results[i]["pos_term_off_fit"] = fit
-            self.make_plot(csv_name, f"{v} to 0V, termination resistor", pos_ch, fit[0][1])
-
-            #Measure the ramp from 0 to negative voltage with open termination
-            v = self.json_data['caenR8033DM_open_voltage']
-            self.c.set_HV_value(neg_ch, v)
-            print(f"{self.prefix} --> Turning Channel {neg_ch} HV from 0 to -{v}V with open termination")
-            self.k.set_relay(1 << i, 1 << i)
-            self.c.turn_on(neg_ch)
-            print(f"{self.prefix} --> HV reached max value, waiting {self.json_data['hv_stability_wait']} seconds to stabilize...")
-            time.sleep(self.json_data['hv_stability_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_neg_open_on.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, neg_ch, on = True, term = False)
-            hv_results[i]["neg_open_on_fit"] = fit
-            hv_results[i]["neg_open_V"] = self.c.get_voltage(neg_ch)
-            hv_results[i]["neg_open_I"] = self.c.get_current(neg_ch)
-            self.make_plot(csv_name, f"0 to -{v}V, open termination", neg_ch, fit[0][1], [v-5, v+5])
-
-            #Measure the ramp from negative voltage to 0 with open termination
-            print(f"{self.prefix} --> Turning Channel {i} HV from -{v}V to 0 with open termination")
-            self.c.turn_off(neg_ch)
-            # print(f"{self.prefix} --> HV turned off, waiting {self.json_data['hv_stability_wait']} seconds to stabilize...")
-            # time.sleep(self.json_data['hv_stability_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_neg_open_off.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, neg_ch, on = False, term = False)
-            hv_results[i]["neg_open_off_fit"] = fit
-            self.make_plot(csv_name, f"-{v} to 0V, open termination", neg_ch, fit[0][1])
-
-            #Measure the ramp from 0 to negative voltage with 10k termination
-            v = self.json_data['caenR8033DM_term_voltage']
-            self.c.set_HV_value(neg_ch, v)
-            print(f"{self.prefix} --> Turning Channel {i} HV from 0 to -{v}V with 10k termination")
-            self.k.set_relay(1 << i, 0)
-            self.c.turn_on(neg_ch)
-            print(f"{self.prefix} --> HV reached max value, waiting {self.json_data['hv_termination_wait']} seconds to stabilize...")
-            time.sleep(self.json_data['hv_termination_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_neg_term_on.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, neg_ch, on = True, term = True)
-            hv_results[i]["neg_term_on_fit"] = fit
-            hv_results[i]["neg_term_V"] = self.c.get_voltage(neg_ch)
-            hv_results[i]["neg_term_I"] = self.c.get_current(neg_ch)
-            self.make_plot(csv_name, f"0 to -{v}V, termination resistor", neg_ch, fit[0][1], [v-5, v+5])
-
-            #Measure the ramp from 0 to negative voltage with 10k termination
-            print(f"{self.prefix} --> Turning Channel {i} HV from -{v}V to 0 with 10k termination")
-            self.c.turn_off(neg_ch)
-            # print(f"{self.prefix} --> HV turned off, waiting {self.json_data['hv_stability_wait']} seconds to stabilize...")
-            # time.sleep(self.json_data['hv_stability_wait'])
-
-            csv_name = f"{self.test_name}_ch{i}_neg_term_off.csv"
-            self.record_hv_data(csv_name)
-            fit = self.hv_curve_fit(csv_name, neg_ch, on = False, term = True)
-            hv_results[i]["neg_term_off_fit"] = fit
-            self.make_plot(csv_name, f"-{v} to 0V, termination resistor", neg_ch, fit[0][1])
-
+        with self.station.lock("rigol1"):
             self.r1.power("OFF", "hvpullup")
             self.r1.power("OFF", "hvpullup2")
 
-            #Voltage is in volts, current is in microamps, R in Mohms
-            try:
-                hv_results[i]["pos_open_R"] = float(hv_results[i]["pos_open_V"])/float(hv_results[i]["pos_open_I"])
-            except:
-                hv_results[i]["pos_open_R"] = 0
-            try:
-                hv_results[i]["pos_term_R"] = float(hv_results[i]["pos_term_V"])/float(hv_results[i]["pos_term_I"])
-            except:
-                hv_results[i]["pos_term_R"] = 0
-            try:
-                hv_results[i]["neg_open_R"] = float(hv_results[i]["neg_open_V"])/float(hv_results[i]["neg_open_I"])
-            except:
-                hv_results[i]["neg_open_R"] = 0
-            try:
-                hv_results[i]["neg_term_R"] = float(hv_results[i]["neg_term_V"])/float(hv_results[i]["neg_term_I"])
-            except:
-                hv_results[i]["neg_term_R"] = 0
-
-            print(f"{self.prefix} --> Channel {i} HV results are {hv_results[i]}")
-
-            for num,j in enumerate(["pos_open_R", "neg_open_R"]):
-                max_val = self.json_data["hv_resistance_open_max"]
-                min_val = self.json_data["hv_resistance_open_min"]
-
-                if ((float(hv_results[i][j]) < max_val) and (float(hv_results[i][j]) > min_val)):
-                    self.ws.cell(row=self.row, column=18+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]), self.rounding_factor)}Mohm")
-                    self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Pass"
-                else:
-                    self.ws.cell(row=self.row, column=18+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]), self.rounding_factor)}Mohm").style = "fail"
-                    self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Fail"
-                    self.hv_test_result = False
-
-            for num,j in enumerate(["pos_term_R", "neg_term_R"]):
-                max_val = self.json_data["hv_resistance_term_max"]
-                min_val = self.json_data["hv_resistance_term_min"]
-
-                if ((float(hv_results[i][j]) < max_val) and (float(hv_results[i][j]) > min_val)):
-                    self.ws.cell(row=self.row, column=21+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]*1E3), self.rounding_factor)}kohm")
-                    self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Pass"
-                else:
-                    self.ws.cell(row=self.row, column=21+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]*1E3), self.rounding_factor)}kohm").style = "fail"
-                    self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Fail"
-                    self.hv_test_result = False
-
-            for num,j in enumerate(["pos_open", "pos_term", "neg_open", "neg_term"]):
-                j_on = j + "_on_fit"
-                j_off = j + "_off_fit"
-                if ((float(hv_results[i][j_on][0][1]) < self.json_data["hv_tau_max"]) and (float(hv_results[i][j_on][0][1]) > self.json_data["hv_tau_min"])):
-                    self.ws.cell(row=self.row, column=19+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_on][0][1]), self.rounding_factor))
-                    self.datastore['Tests'][f'hv_on_fit_test_ch{i}_{j_on}'] = "Pass"
-                else:
-                    self.ws.cell(row=self.row, column=19+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_on][0][1]), self.rounding_factor)).style = "fail"
-                    self.datastore['Tests'][f'hv_on_fit_test_ch{i}_{j_on}'] = "Fail"
-                    self.hv_test_result = False
-                if ((float(hv_results[i][j_off][0][1]) < self.json_data["hv_tau_max"]) and (float(hv_results[i][j_off][0][1]) > self.json_data["hv_tau_min"])):
-                    self.ws.cell(row=self.row, column=20+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_off][0][1]), self.rounding_factor))
-                    self.datastore['Tests'][f'hv_off_fit_test_ch{i}_{j_off}'] = "Pass"
-                else:
-                    self.ws.cell(row=self.row, column=20+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_off][0][1]), self.rounding_factor)).style = "fail"
-                    self.datastore['Tests'][f'hv_off_fit_test_ch{i}_{j_off}'] = "Fail"
-                    self.hv_test_result = False
-
-            self.datastore[f'hv_ch{i}'] = {}
-            for j in ["pos_open_V", "pos_open_I", "pos_open_R", "neg_open_V", "neg_open_I", "neg_open_R", "pos_open_on_fit", "pos_open_off_fit", "neg_open_on_fit", "neg_open_off_fit",
-                      "pos_term_V", "pos_term_I", "pos_term_R", "neg_term_V", "neg_term_I", "neg_term_R", "pos_term_on_fit", "pos_term_off_fit", "neg_term_on_fit", "neg_term_off_fit"]:
-                self.datastore[f'hv_ch{i}'][j] = hv_results[i][j]
-
-    def record_hv_data(self, name):
-        data = []
-        cycle_start_time = time.time()
-        time_string = datetime.fromtimestamp(cycle_start_time)
-        prev_measurement = cycle_start_time - 1
+        #The fan and heater tests may still be writing their results if they ran during the HV test
+        with self.station.workbook:
+            for i in channels:
+                #Voltage is in volts, current is in microamps, R in Mohms
+                try:
+                    hv_results[i]["pos_open_R"] = float(hv_results[i]["pos_open_V"])/float(hv_results[i]["pos_open_I"])
+                except:
+                    hv_results[i]["pos_open_R"] = 0
+                try:
+                    hv_results[i]["pos_term_R"] = float(hv_results[i]["pos_term_V"])/float(hv_results[i]["pos_term_I"])
+                except:
+                    hv_results[i]["pos_term_R"] = 0
+                try:
+                    hv_results[i]["neg_open_R"] = float(hv_results[i]["neg_open_V"])/float(hv_results[i]["neg_open_I"])
+                except:
+                    hv_results[i]["neg_open_R"] = 0
+                try:
+                    hv_results[i]["neg_term_R"] = float(hv_results[i]["neg_term_V"])/float(hv_results[i]["neg_term_I"])
+                except:
+                    hv_results[i]["neg_term_R"] = 0
+
+                print(f"{self.prefix} --> Channel {i} HV results are {hv_results[i]}")
+
+                for num,j in enumerate(["pos_open_R", "neg_open_R"]):
+                    max_val = self.json_data["hv_resistance_open_max"]
+                    min_val = self.json_data["hv_resistance_open_min"]
+
+                    if ((float(hv_results[i][j]) < max_val) and (float(hv_results[i][j]) > min_val)):
+                        self.ws.cell(row=self.row, column=18+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]), self.rounding_factor)}Mohm")
+                        self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Pass"
+                    else:
+                        self.ws.cell(row=self.row, column=18+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]), self.rounding_factor)}Mohm").style = "fail"
+                        self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Fail"
+                        self.hv_test_result = False
+
+                for num,j in enumerate(["pos_term_R", "neg_term_R"]):
+                    max_val = self.json_data["hv_resistance_term_max"]
+                    min_val = self.json_data["hv_resistance_term_min"]
+
+                    if ((float(hv_results[i][j]) < max_val) and (float(hv_results[i][j]) > min_val)):
+                        self.ws.cell(row=self.row, column=21+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]*1E3), self.rounding_factor)}kohm")
+                        self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Pass"
+                    else:
+                        self.ws.cell(row=self.row, column=21+(i*self.hv_cols)+(num*6), value=f"{round(float(hv_results[i][j]*1E3), self.rounding_factor)}kohm").style = "fail"
+                        self.datastore['Tests'][f'hv_test_ch{i}_{j}'] = "Fail"
+                        self.hv_test_result = False
+
+                for num,j in enumerate(["pos_open", "pos_term", "neg_open", "neg_term"]):
+                    j_on = j + "_on_fit"
+                    j_off = j + "_off_fit"
+                    if ((float(hv_results[i][j_on]["tau"]) < self.json_data["hv_tau_max"]) and (float(hv_results[i][j_on]["tau"]) > self.json_data["hv_tau_min"])):
+                        self.ws.cell(row=self.row, column=19+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_on]["tau"]), self.rounding_factor))
+                        self.datastore['Tests'][f'hv_on_fit_test_ch{i}_{j_on}'] = "Pass"
+                    else:
+                        self.ws.cell(row=self.row, column=19+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_on]["tau"]), self.rounding_factor)).style = "fail"
+                        self.datastore['Tests'][f'hv_on_fit_test_ch{i}_{j_on}'] = "Fail"
+                        self.hv_test_result = False
+                    if ((float(hv_results[i][j_off]["tau"]) < self.json_data["hv_tau_max"]) and (float(hv_results[i][j_off]["tau"]) > self.json_data["hv_tau_min"])):
+                        self.ws.cell(row=self.row, column=20+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_off]["tau"]), self.rounding_factor))
+                        self.datastore['Tests'][f'hv_off_fit_test_ch{i}_{j_off}'] = "Pass"
+                    else:
+                        self.ws.cell(row=self.row, column=20+(i*self.hv_cols)+(num*3), value=round(float(hv_results[i][j_off]["tau"]), self.rounding_factor)).style = "fail"
+                        self.datastore['Tests'][f'hv_off_fit_test_ch{i}_{j_off}'] = "Fail"
+                        self.hv_test_result = False
+
+                self.datastore[f'hv_ch{i}'] = {}
+                for j in ["pos_open_V", "pos_open_I", "pos_open_R", "neg_open_V", "neg_open_I", "neg_open_R", "pos_open_on_fit", "pos_open_off_fit", "neg_open_on_fit", "neg_open_off_fit",
+                          "pos_term_V", "pos_term_I", "pos_term_R", "neg_term_V", "neg_term_I", "neg_term_R", "pos_term_on_fit", "pos_term_off_fit", "neg_term_on_fit", "neg_term_off_fit"]:
+                    self.datastore[f'hv_ch{i}'][j] = hv_results[i][j]
+
+    #Ramps the polarity's CAEN channel of every PCB channel in the group up and back down with the termination given, recording both soaks
+    def hv_phase(self, group, polarity, term, hv_results):
+        phase = self.hv_phase_settings(group, polarity, term)
+        chs = phase['chs']
+
+        #Measure the ramp from 0 to the voltage
+        self.c.set_HV_value(chs, phase['v'])
+        print(f"{self.prefix} --> Turning Channels {chs} HV from 0 to {phase['sign']}{phase['v']}V with {phase['description']}")
+        with self.station.lock("keysight"):
+            self.k.set_relay(phase['hv_mask'], phase['term_mask'])
+        self.c.turn_on(chs)
+        print(f"{self.prefix} --> HV reached max value, waiting {phase['wait']} seconds to stabilize...")
+        time.sleep(phase['wait'])
+
+        trace = self.record_hv_data(self.hv_phase_csv(phase, True), [(ch, True, phase['term']) for ch in chs])
+        voltages, currents = self.c.get_monitors(chs)
+        self.hv_phase_results(group, phase, True, trace, hv_results, voltages, currents)
+
+        #Measure the ramp from the voltage back to 0
+        print(f"{self.prefix} --> Turning Channels {chs} HV from {phase['sign']}{phase['v']}V to 0 with {phase['description']}")
+        self.c.turn_off(chs)
+
+        trace = self.record_hv_data(self.hv_phase_csv(phase, False), [(ch, False, phase['term']) for ch in chs])
+        self.hv_phase_results(group, phase, False, trace, hv_results)
+
+    #Everything about a phase that depends on the group, polarity and termination
+    #The relay settings for the group are the single channel settings ORed together. The HV bit picks negative and the termination bit leaves it open
+    def hv_phase_settings(self, group, polarity, term):
+        phase = {}
+        phase['group'] = group
+        phase['polarity'] = polarity
+        phase['term'] = term
+        phase['chs'] = [self.json_data[f"pcb_ch_{i}_{polarity}"] for i in group]
+        phase['mask'] = 0
+        for i in group:
+            phase['mask'] |= 1 << i
+        if (term):
+            phase['kind'] = "term"
+            phase['v'] = self.json_data['caenR8033DM_term_voltage']
+            phase['wait'] = self.json_data['hv_termination_wait']
+            phase['description'] = "10k termination"
+            phase['plot_description'] = "termination resistor"
+            phase['term_mask'] = 0
+        else:
+            phase['kind'] = "open"
+            phase['v'] = self.json_data['caenR8033DM_open_voltage']
+            phase['wait'] = self.json_data['hv_stability_wait']
+            phase['description'] = "open termination"
+            phase['plot_description'] = "open termination"
+            phase['term_mask'] = phase['mask']
+        if (polarity == "neg"):
+            phase['sign'] = "-"
+            phase['hv_mask'] = phase['mask']
+        else:
+            phase['sign'] = ""
+            phase['hv_mask'] = 0
+        return phase
+
+    #With one channel in the group, the file names are the same as when channels were tested one at a time
+    def hv_phase_csv(self, phase, on):
+        group_name = "_".join(str(i) for i in phase['group'])
+        return f"{self.test_name}_ch{group_name}_{phase['polarity']}_{phase['kind']}_{'on' if on else 'off'}.csv"
+
+    #Fits and plots each channel of the group from the capture. For the ramp up, the voltages and currents at the end are kept too
+    def hv_phase_results(self, group, phase, on, trace, hv_results, voltages = None, currents = None):
+        name = f"{phase['polarity']}_{phase['kind']}_{'on' if on else 'off'}"
+        v = phase['v']
+        for num, (i, ch) in enumerate(zip(group, phase['chs'])):
+            fit = self.hv_curve_fit(trace, ch, on = on, term = phase['term'])
+            hv_results[i][f"{name}_fit"] = fit.as_dict()
+            if (on):
+                hv_results[i][f"{phase['polarity']}_{phase['kind']}_V"] = voltages[num]
+                hv_results[i][f"{phase['polarity']}_{phase['kind']}_I"] = currents[num]
+                self.make_plot(f"{self.test_name}_ch{i}_{name}.csv", f"0 to {phase['sign']}{v}V, {phase['plot_description']}", ch, fit.tau, [v-5, v+5], trace = trace)
+            else:
+                self.make_plot(f"{self.test_name}_ch{i}_{name}.csv", f"{phase['sign']}{v} to 0V, {phase['plot_description']}", ch, fit.tau, trace = trace)
+
+    #watch is a list of (CAEN channel, on, term) being fit from this capture. In adaptive mode the capture stops early once all their fits have converged
+    def record_hv_data(self, name, watch = None):
+        from hv_trace import HVTraceWriter
+        self.start_station_tests()
+        sampler = HVSampler(self.json_data['hv_seconds_interval'], self.json_data['hv_minutes_duration'] * 60, self.json_data['hv_late_policy'])
+        monitor = self.hv_convergence_monitor(watch)
+        time_string = datetime.now()
         print(f"{self.prefix} --> Collecting data for {name} for {self.json_data['hv_minutes_duration']} minutes starting at {time_string}...")
-        while (time.time() - cycle_start_time < (self.json_data['hv_minutes_duration'] * 60)):
-            if (time.time() > prev_measurement + self.json_data['hv_seconds_interval']):
-                #print(f"{self.prefix} --> Measurement taken at {time.time()}")
-                prev_measurement = prev_measurement + self.json_data['hv_seconds_interval']
-                datum = [datetime.now()]
-                for i in range(16):
-                    datum.append(self.c.get_voltage(i))
-                    datum.append(self.c.get_current(i))
-                data.append(datum)
-        with open(os.path.join(self.results_path, name), 'w') as fp:
-            csv_writer = csv.writer(fp, delimiter=',')
-            csv_writer.writerows(data)
+        #Rows go straight to the file as they're taken, so an aborted soak still leaves the partial trace behind
+        binary = (self.json_data['hv_trace_binary'] == "True")
+        capacity = math.ceil(sampler.duration / sampler.interval)
+        #With events on, the changes pushed between ticks go in as rows of their own too, so the trace has more than one row per tick
+        event_rows = 0
+        last = None
+        voltages = currents = None
+        with HVTraceWriter(os.path.join(self.results_path, name), self.json_data['hv_trace_flush_rows'], self.json_data['hv_trace_fsync'], binary, len(self.c.channels), capacity) as writer:
+            for sample in sampler:
+                now = datetime.now()
+                if (last is not None):
+                    for t, event_voltages, event_currents in self.c.get_monitor_events(last.timestamp(), now.timestamp(), voltages, currents):
+                        writer.writerow(self.hv_row(datetime.fromtimestamp(t), event_voltages, event_currents))
+                        event_rows += 1
+                voltages, currents = self.c.get_monitors()
+                writer.writerow(self.hv_row(now, voltages, currents))
+                last = now
+                if (monitor and monitor.due(sampler.elapsed())):
+                    trace = writer.trace()
+                    if (monitor.check(sampler.elapsed(), trace.elapsed(), [self.hv_fit_data(trace, *i) for i in watch])):
+                        break
+            trace = writer.trace()
+        #Keep a record of how well the sample timing was kept for each capture
+        stats = sampler.stats()
+        stats['event_rows'] = event_rows
+        if (monitor):
+            self.hv_early_stop_stats(stats, monitor, sampler.elapsed(), sampler.duration)
+        self.datastore['hv_sampling'][name] = stats
+        if (stats['late_samples'] or stats['skipped_ticks']):
+            print(f"{self.prefix} --> {stats['late_samples']} samples were late and {stats['skipped_ticks']} were skipped, worst was {round(stats['lateness_max'], 3)} seconds late")
         #input("ok?")
-
-    def hv_curve_fit(self, name, ch, on = True, term = False):
-        ch_datetime = []
-        ch_voltage = []
-        ch_current = []
-        with open(os.path.join(self.results_path, name), 'r', newline='') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=',')
-            for row in spamreader:
-                ch_datetime.append(datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S.%f'))
-                ch_voltage.append(float(row[1 + (ch*2)]))
-                if (term):
-                    ch_current.append(float(row[2 + (ch*2)])/1000)
-                else:
-                    ch_current.append(float(row[2 + (ch*2)]))
+        #The files are for the archive, the fit and plots use the capture that's already in memory
+        return trace
+
+    #A trace row is the time followed by the voltage and current of each channel
+    def hv_row(self, time_string, voltages, currents):
+        datum = [time_string]
+        for v, c in zip(voltages, currents):
+            datum.append(v)
+            datum.append(c)
+        return datum
+
+    #Adaptive captures refit the watched channels as the soak goes, see ConvergenceMonitor in hv_fit.py
+    #hv_minutes_duration is still the longest a capture will go
+    def hv_convergence_monitor(self, watch):
+        if ((not watch) or (self.json_data['hv_adaptive'] != "True")):
+            return None
+        from hv_fit import ConvergenceMonitor
+        return ConvergenceMonitor(self.json_data['hv_adaptive_tau_tolerance'], self.json_data['hv_adaptive_asymptote_tolerance'],
+                                  self.json_data['hv_adaptive_min_minutes'] * 60, self.json_data['hv_adaptive_refit_seconds'])
+
+    #Why the capture stopped and how much of the maximum duration that saved, next to the sampling statistics in the datastore
+    def hv_early_stop_stats(self, stats, monitor, elapsed, duration):
+        stats['stop_reason'] = monitor.reason
+        stats['stopped_after'] = elapsed
+        stats['seconds_saved'] = max(0, duration - elapsed)
+        stats['refits'] = monitor.refits
+        if (monitor.reason == "converged"):
+            print(f"{self.prefix} --> Fits converged, stopped the capture after {round(elapsed)} seconds, {round(duration - elapsed)} seconds early")
+
+    #The current is fit when the HV turns on and the voltage when it turns off. With the 10k termination the current is scaled down
+    def hv_fit_data(self, trace, ch, on, term):
         if (on):
-            data = ch_current
+            data = trace.current(ch)
+            if (term):
+                data = data / 1000
+        else:
+            data = trace.voltage(ch)
+        return data
+
+    #The data can be the trace returned by record_hv_data, or the file name of a capture in the results directory
+    def hv_curve_fit(self, data, ch, on = True, term = False):
+        from hv_trace import HVTrace, load_trace
+        from hv_fit import fit_exponential
+        if (isinstance(data, HVTrace)):
+            trace = data
         else:
-            data = ch_voltage
+            trace = load_trace(os.path.join(self.results_path, data), [ch])
+        data = self.hv_fit_data(trace, ch, on, term)
         #print(f"For channel {ch}, grabbed column {2 + (ch*2)} and got this data")
-        #print(ch_current)
-        first_time = ch_datetime[0]
-        ch_timedelta = [i-first_time for i in ch_datetime]
-        ch_time = [datetime(2024, 1, 1, 0, i.seconds//60%60, i.seconds%60, 0) for i in ch_timedelta]
-
-        def exp_fit(x, a, b, c):
-            y = a*np.exp(-b*x) + c
-            return y
+        #print(data)
 
-        first_timestamp = ch_time[0].timestamp()
-        time_seconds = [dt.timestamp() - first_timestamp for dt in ch_time]
-        try:
-            fit = curve_fit(exp_fit, time_seconds, data)
-        except RuntimeError:
-            fit = [[0,0]]
-        #The result is an array like
-        #[
-        #    "[-0.0003239   0.04760632  0.29665177]",
-
-        #    "[[ 4.03901010e-10 -5.76474012e-08 -2.84934772e-12],
-        #    [-5.76474012e-08  2.38199865e-05 -7.01897955e-09],
-        #    [-2.84934772e-12 -7.01897955e-09  1.26525944e-11]]"
-        #]
-        #The first array is the convergant results for the 3 parameters a, b, and c
-        #The second array is the confidence levels for each based on the covarience with the other variables
-        #Low numbers less than one mean that the confidence is high
-        #https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.curve_fit.html
+        #Returns an ExpFit with a, tau and c from a*e^(-tau*t)+c, tau's uncertainty, which method got there and how long it took
+        #If no method converges, tau is 0 so it fails the tau limits
+        fit = fit_exponential(trace.elapsed(), data)
+        if (not fit.ok()):
+            print(f"{self.prefix} --> Fit for channel {ch} did not converge")
         return fit
 
-    def make_hv_plots(self):
-        ch0_pos_open_fit = self.datastore['hv_ch0']['pos_open_fit'][0][1]
-        self.make_plot(f"{self.test_name}_ch0_pos_open_on", "0 to 2kV, open termination", True, True, 0, ch0_pos_open_fit)
-        # self.make_plot(f"{self.test_name}_ch0_pos_open_off", "2kV to 0, open termination", False, True)
-        ch0_pos_term_fit = self.datastore['hv_ch0']['pos_term_fit'][0][1]
-        self.make_plot(f"{self.test_name}_ch0_pos_10k_on", "0 to 2kV, 10k termination", True, True, 0, ch0_pos_term_fit)
-        #self.make_plot(f"{self.test_name}_ch0_pos_10k_off", "2kV to 0, 10k termination", False, True, 0)
-
-        ch0_neg_open_fit = self.datastore['hv_ch0']['neg_open_fit'][0][1]
-        self.make_plot(f"{self.test_name}_ch0_neg_open_on", "0 to -2kV, open termination", True, False, 8, ch0_neg_open_fit)
-        # self.make_plot(f"{self.test_name}_ch0_neg_open_off", "-2kV to 0, open termination", False, False)
-        ch0_neg_term_fit = self.datastore['hv_ch0']['neg_term_fit'][0][1]
-        self.make_plot(f"{self.test_name}_ch0_neg_10k_on", "0 to -2kV, 10k termination", True, False, 8, ch0_neg_term_fit)
-        #self.make_plot(f"{self.test_name}_ch0_neg_10k_off", "-2kV to 0, 10k termination", False, True, 8)
-
-    def make_plot(self, filename, name, ch, fit=None, axes = None):
-        ch1_time, ch1_voltage, ch1_current = self.get_ch_data(os.path.join(self.results_path, filename), ch)
+    #If the trace isn't given, it's read back from the file, otherwise the file name is just used to name the plot
+    #The plot itself is drawn by the plot pool in the background, call self.plot_pool.wait() to make sure they're all saved
+    def make_plot(self, filename, name, ch, fit=None, axes = None, trace = None):
+        if (trace is None):
+            trace = os.path.join(self.results_path, filename)
+        ch1_time, ch1_voltage, ch1_current = self.get_ch_data(trace, ch)
         # self.make_plot(f"{self.test_name}_ch0_neg_10k_off", "-2kV to 0, 10k termination", False, False)
-
-        fig = plt.figure(figsize=(16, 12), dpi=80)
-        ax = fig.add_subplot(1,1,1)
-
-        ax.plot(ch1_time, ch1_current, label="Ch Current")
-        self.format_plot(ax)
-
-        ax2 = ax.twinx()
-        ax2.plot(ch1_time, ch1_voltage, label="Ch Voltage", color="red")
-
-        fig.suptitle((name), fontsize=36)
-
-        ax.set_xlabel("Time (Minutes:Seconds)", fontsize=24)
-        ax.set_ylabel("Current (uA)", fontsize=24)
-
-        # ax.set_xlim([0,150])
-        if (axes):
-            ax2.set_ylim([axes[0],axes[1]])
-        ax2.set_ylabel("Voltage (V)", fontsize=24)
-        self.format_plot(ax2)
-
-        if fit:
-            textstr = r'$\tau=%.4f$' % (fit)
-            props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
-            ax.text(0.75, 0.75, textstr, transform=ax.transAxes, fontsize=24,
-            verticalalignment='top', bbox=props)
-
-        fig.legend(loc='lower left', prop={'size': 20}, ncol=2)
         stem = Path(filename).stem
-        fig.savefig(os.path.join(self.results_path, f"{stem}.png"))
-        plt.close(fig)
+        #Copies so the job doesn't hold on to the capture's arrays or memory map
+        self.plot_pool.submit(os.path.join(self.results_path, f"{stem}.png"), name, ch1_time.copy(), ch1_voltage.copy(), ch1_current.copy(), fit, axes)
 
+    #Takes either a trace or the path to one
     def get_ch_data(self, data_file, ch):
-        ch1_datetime = []
-        ch1_voltage = []
-        ch1_current = []
-        with open(data_file, 'r', newline='') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=',')
-            for row in spamreader:
-                ch1_datetime.append(datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S.%f'))
-                ch1_voltage.append(float(row[1+(ch*2)]))
-                ch1_current.append(float(row[2+(ch*2)]))
-
-        first_time = ch1_datetime[0]
-        ch1_timedelta = [i-first_time for i in ch1_datetime]
-        ch1_time = [datetime(2024, 1, 1, 0, i.seconds//60%60, i.seconds%60, 0) for i in ch1_timedelta]
-        return ch1_time, ch1_voltage, ch1_current
-
-    def format_plot(self, ax):
-        tick_size = 18
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%M:%S'))
-        ax.tick_params(axis='x', labelsize=tick_size, colors='black')  # Set tick size and color here
-        ax.tick_params(axis='y', labelsize=tick_size, colors='black')  # Set tick size and color here
+        from hv_trace import load_trace
+        trace = load_trace(data_file, [ch])
+        return trace.plot_time(), trace.voltage(ch), trace.current(ch)
 
     def beep_sequence(self):
         #First beep is always longer for some reason
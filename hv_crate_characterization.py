@@ -5,10 +5,10 @@ import csv
 import os
 import time
 from datetime import datetime
-import openpyxl
 from datetime import datetime
 from rigol_dp832a import RigolDP832A
 from caen_r8033dm_wrapper import CAENR8033DM_WRAPPER
+from hv_sampler import HVSampler
 
 class LDOmeasure:
     def __init__(self, config_file, name = None):
@@ -21,8 +21,7 @@ class LDOmeasure:
         #Initialize all instruments first so that you don't waste time with input if something is not connected
         self.c = CAENR8033DM_WRAPPER(self.json_data)
         self.r1 = RigolDP832A(self.rm, self.json_data, 1)
-        self.r1.setup_hvpullup()
-        self.r1.setup_hvpullup2()
+        self.r1.setup_channels(["hvpullup", "hvpullup2"])
 
         #Now we can get the input for the name of the test
         if (name):
@@ -35,14 +34,20 @@ class LDOmeasure:
         #Want to also include what the inputs for this particular test was
         self.seconds_interval = 1
         self.minutes_duration = 5
+        self.late_policy = self.json_data['hv_late_policy']
         self.datastore = {}
         self.datastore['input_params'] = self.json_data
         self.datastore['test_name'] = self.test_name
         self.datastore['seconds_interval'] = self.seconds_interval
         self.datastore['minutes_duration'] = self.minutes_duration
+        self.datastore['hv_sampling'] = {}
         self.start_time = datetime.now()
         self.datastore['start_time'] = self.start_time
-        self.sequence()
+        #The CAEN event stream is turned off however the sequence ends, including the sys.exit() calls along the way
+        try:
+            self.sequence()
+        finally:
+            self.c.close()
 
     def sequence(self):
         data = []
@@ -68,21 +73,7 @@ class LDOmeasure:
         self.r1.power("OFF", "hvpullup2")
         input("Ready for all channel connected and positive test?")
         self.c.turn_on([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15])
-        data = []
-        cycle_start_time = time.time()
-        prev_measurement = cycle_start_time - 1
-        while (time.time() - cycle_start_time < (self.minutes_duration * 60)):
-            if (time.time() > prev_measurement + self.seconds_interval):
-                print(f"measure at {time.time()}")
-                prev_measurement = prev_measurement + self.seconds_interval
-                datum = [datetime.now()]
-                for i in range(16):
-                    datum.append(self.c.get_voltage(i))
-                    datum.append(self.c.get_current(i))
-                data.append(datum)
-        with open(f"{self.test_name}_multiple_plugged_positive.csv", 'w') as fp:
-            csv_writer = csv.writer(fp, delimiter=',')
-            csv_writer.writerows(data)
+        self.record_soak(f"{self.test_name}_multiple_plugged_positive.csv")
 
         self.c.turn_off([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15])
 
@@ -107,63 +98,42 @@ class LDOmeasure:
 
         input("Ready for all channel connected test?")
         self.c.turn_on(0)
-        data = []
-        cycle_start_time = time.time()
-        prev_measurement = cycle_start_time - 1
-        while (time.time() - cycle_start_time < (self.minutes_duration * 60)):
-            if (time.time() > prev_measurement + self.seconds_interval):
-                print(f"measure at {time.time()}")
-                prev_measurement = prev_measurement + self.seconds_interval
-                datum = [datetime.now()]
-                for i in range(8):
-                    datum.append(self.c.get_voltage(i))
-                    datum.append(self.c.get_current(i))
-                data.append(datum)
-        with open(f"{self.test_name}unplugged_all.csv", 'w') as fp:
-            csv_writer = csv.writer(fp, delimiter=',')
-            csv_writer.writerows(data)
+        self.record_soak(f"{self.test_name}unplugged_all.csv", list(range(8)))
 
         self.c.turn_off(0)
 
         input("Ready for all channel connected and positive test?")
         self.c.turn_on([0, 1, 2, 3, 4, 5, 6, 7])
-        data = []
-        cycle_start_time = time.time()
-        prev_measurement = cycle_start_time - 1
-        while (time.time() - cycle_start_time < (self.minutes_duration * 60)):
-            if (time.time() > prev_measurement + self.seconds_interval):
-                print(f"measure at {time.time()}")
-                prev_measurement = prev_measurement + self.seconds_interval
-                datum = [datetime.now()]
-                for i in range(16):
-                    datum.append(self.c.get_voltage(i))
-                    datum.append(self.c.get_current(i))
-                data.append(datum)
-        with open(f"{self.test_name}_multiple_plugged_positive.csv", 'w') as fp:
-            csv_writer = csv.writer(fp, delimiter=',')
-            csv_writer.writerows(data)
+        self.record_soak(f"{self.test_name}_multiple_plugged_positive.csv")
 
         self.c.turn_off([0, 1, 2, 3, 4, 5, 6, 7])
 
         input("Ready for all channel connected and negative test?")
         self.c.turn_on([0, 8,9,10,11,12,13,14,15])
+        self.record_soak(f"{self.test_name}_multiple_plugged_negative.csv")
+
+        self.c.turn_off([0, 8,9,10,11,12,13,14,15])
+
+        #Keeps the sampling statistics of every soak next to the CSVs
+        with open(f"{self.test_name}_characterization.json", 'w', encoding='utf-8') as f:
+            json.dump(self.datastore, f, ensure_ascii=False, indent=4, default=str)
+
+    #Samples the monitors of the channels given (all 16 if none are) every seconds_interval for minutes_duration and saves them to the file
+    def record_soak(self, filename, chs = None):
         data = []
-        cycle_start_time = time.time()
-        prev_measurement = cycle_start_time - 1
-        while (time.time() - cycle_start_time < (self.minutes_duration * 60)):
-            if (time.time() > prev_measurement + self.seconds_interval):
-                print(f"measure at {time.time()}")
-                prev_measurement = prev_measurement + self.seconds_interval
-                datum = [datetime.now()]
-                for i in range(16):
-                    datum.append(self.c.get_voltage(i))
-                    datum.append(self.c.get_current(i))
-                data.append(datum)
-        with open(f"{self.test_name}_multiple_plugged_negative.csv", 'w') as fp:
+        sampler = HVSampler(self.seconds_interval, self.minutes_duration * 60, self.late_policy)
+        for sample in sampler:
+            print(f"measure at {time.time()}")
+            datum = [datetime.now()]
+            voltages, currents = self.c.get_monitors(chs)
+            for v, c in zip(voltages, currents):
+                datum.append(v)
+                datum.append(c)
+            data.append(datum)
+        with open(filename, 'w') as fp:
             csv_writer = csv.writer(fp, delimiter=',')
             csv_writer.writerows(data)
-
-        self.c.turn_off([0, 8,9,10,11,12,13,14,15])
+        self.datastore['hv_sampling'][filename] = sampler.stats()
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
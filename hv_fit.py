@@ -0,0 +1,206 @@
+import time
+import math
+import numpy as np
+
+#Fits y = a*e^(-tau*t) + c to an HV capture. Like the rest of the test, "tau" here is the rate b in the exponent, in 1/seconds
+#The order of attempts is:
+#   "closed_form"  - Jacquelin's integral regression. Integrating dy/dt = -tau*(y - c) gives y = y0 - tau*S + tau*c*(t - t0),
+#                    where S is the running integral of y, so tau and c come out of one linear least squares, then a and c
+#                    out of a second one with tau fixed. No starting values and no iterations, so it's deterministic and fast
+#                    If tau's uncertainty is already below fast_tolerance this is the answer
+#   "gauss_newton" - a few damped Gauss-Newton steps starting from the closed form, to get the actual least squares fit
+#   "curve_fit"    - scipy as the last resort, started from the closed form with tau bounded to what the sampling can resolve
+#   "failed"       - nothing converged, tau is 0 so that the test limits treat it as a fail like before
+#tau is bounded to 0 (no decay) up to 1/(median sample spacing), anything faster can't be resolved by the capture
+class ExpFit:
+    def __init__(self, a = 0.0, tau = 0.0, c = 0.0, tau_err = math.inf, method = "failed", fit_time = 0.0, points = 0):
+        self.a = a
+        self.tau = tau
+        self.c = c
+        self.tau_err = tau_err          #One standard deviation, from the covariance of the fit like curve_fit's pcov
+        self.method = method
+        self.fit_time = fit_time        #Seconds spent fitting
+        self.points = points
+
+    def ok(self):
+        return self.method != "failed"
+
+    def tau_rel_err(self):
+        if (self.tau == 0):
+            return math.inf
+        return abs(self.tau_err / self.tau)
+
+    #For the datastore JSON, which has no infinity, so a tau_err that couldn't be worked out is None
+    def as_dict(self):
+        tau_err = self.tau_err if math.isfinite(self.tau_err) else None
+        return {"a": self.a, "tau": self.tau, "c": self.c, "tau_err": tau_err, "method": self.method,
+                "fit_time": self.fit_time, "points": self.points}
+
+def exp_model(t, a, tau, c):
+    return a*np.exp(-tau*t) + c
+
+def fit_exponential(t, y, fast_tolerance = 0.01, max_iterations = 50):
+    start = time.perf_counter()
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(t) & np.isfinite(y)
+    t = t[keep]
+    y = y[keep]
+    fit = ExpFit(points = len(t))
+    if (len(t) < 4):
+        fit.fit_time = time.perf_counter() - start
+        return fit
+    spacing = np.median(np.diff(t))
+    tau_max = 1/spacing if spacing > 0 else math.inf
+
+    params = closed_form(t, y, tau_max)
+    if (params is not None):
+        err = tau_uncertainty(t, y, *params)
+        if (err / params[1] < fast_tolerance):
+            return finish(fit, params, err, "closed_form", start)
+        refined = gauss_newton(t, y, params, tau_max, max_iterations)
+        if (refined is not None):
+            return finish(fit, refined, tau_uncertainty(t, y, *refined), "gauss_newton", start)
+
+    refined = scipy_fit(t, y, params, tau_max)
+    if (refined is not None):
+        return finish(fit, refined, tau_uncertainty(t, y, *refined), "curve_fit", start)
+    fit.fit_time = time.perf_counter() - start
+    return fit
+
+def finish(fit, params, err, method, start):
+    fit.a, fit.tau, fit.c = [float(i) for i in params]
+    fit.tau_err = float(err)
+    fit.method = method
+    fit.fit_time = time.perf_counter() - start
+    return fit
+
+def closed_form(t, y, tau_max):
+    t0 = t[0]
+    #Trapezoid running integral of y, works for uneven sample spacing too
+    s = np.concatenate(([0.0], np.cumsum(0.5*(y[1:] + y[:-1])*np.diff(t))))
+    basis = np.column_stack((np.ones_like(t), t - t0, s))
+    coeffs = np.linalg.lstsq(basis, y, rcond=None)[0]
+    tau = -coeffs[2]
+    if (not np.isfinite(tau) or tau <= 0 or tau > tau_max):
+        return None
+    #With tau fixed, a and c are linear
+    basis = np.column_stack((np.exp(-tau*t), np.ones_like(t)))
+    a, c = np.linalg.lstsq(basis, y, rcond=None)[0]
+    return np.array([a, tau, c])
+
+#Columns are the derivatives of the model with respect to a, tau and c
+def jacobian(t, a, tau):
+    e = np.exp(-tau*t)
+    return np.column_stack((e, -a*t*e, np.ones_like(t)))
+
+def tau_uncertainty(t, y, a, tau, c):
+    residual = y - exp_model(t, a, tau, c)
+    dof = len(t) - 3
+    if (dof <= 0):
+        return math.inf
+    j = jacobian(t, a, tau)
+    try:
+        cov = np.linalg.inv(j.T @ j) * (residual @ residual) / dof
+    except np.linalg.LinAlgError:
+        return math.inf
+    if (not np.isfinite(cov[1, 1]) or cov[1, 1] < 0):
+        return math.inf
+    return math.sqrt(cov[1, 1])
+
+#Levenberg damped Gauss-Newton, tau is clipped back inside its bounds after each step
+def gauss_newton(t, y, params, tau_max, max_iterations):
+    params = params.copy()
+    residual = y - exp_model(t, *params)
+    cost = residual @ residual
+    damping = 1E-3
+    for i in range(max_iterations):
+        j = jacobian(t, params[0], params[1])
+        jtj = j.T @ j
+        try:
+            step = np.linalg.solve(jtj + damping*np.diag(np.diag(jtj)), j.T @ residual)
+        except np.linalg.LinAlgError:
+            return None
+        trial = params + step
+        trial[1] = min(max(trial[1], 0.0), tau_max)
+        trial_residual = y - exp_model(t, *trial)
+        trial_cost = trial_residual @ trial_residual
+        if (trial_cost <= cost):
+            converged = (cost - trial_cost) <= 1E-12 * max(cost, 1E-300)
+            params, residual, cost = trial, trial_residual, trial_cost
+            damping = max(damping / 10, 1E-9)
+            if (converged or np.all(np.abs(step) <= 1E-10 * (np.abs(params) + 1E-12))):
+                break
+        else:
+            damping *= 10
+            if (damping > 1E9):
+                break
+    if (not np.all(np.isfinite(params)) or params[1] <= 0):
+        return None
+    return params
+
+def scipy_fit(t, y, params, tau_max):
+    from scipy.optimize import curve_fit
+    if (params is None):
+        span = t[-1] - t[0]
+        params = np.array([y[0] - y[-1], min(1/span if span > 0 else 1.0, tau_max), y[-1]])
+    p0 = params.copy()
+    p0[1] = min(max(p0[1], 0.0), tau_max)
+    try:
+        popt, pcov = curve_fit(exp_model, t, y, p0=p0, bounds=([-np.inf, 0.0, -np.inf], [np.inf, tau_max, np.inf]), max_nfev=1000)
+    except (RuntimeError, ValueError):
+        return None
+    if (not np.all(np.isfinite(popt)) or popt[1] <= 0):
+        return None
+    return popt
+
+#Decides when an HV soak has seen enough to stop early. Every refit_interval seconds of the soak, each watched channel is refit
+#A channel has converged when tau's relative uncertainty is below tau_tolerance and the asymptote c moved less than
+#asymptote_tolerance (relative to |a| + |c|) since the last refit. Once every channel has converged for required_passes refits
+#in a row, the soak has gone on for at least min_duration, and each channel's transient has died away, check() says to stop
+#The transient has died away when what's left of it at the latest sample, |a|*e^(-tau*t), is under asymptote_tolerance * |c|
+#The V and I at the end of an on capture go into the resistance tests, so a converged fit alone isn't enough, the current has to have settled
+#The caller stops at its own maximum duration if this never happens
+class ConvergenceMonitor:
+    def __init__(self, tau_tolerance, asymptote_tolerance, min_duration, refit_interval, required_passes = 2):
+        self.tau_tolerance = tau_tolerance
+        self.asymptote_tolerance = asymptote_tolerance
+        self.min_duration = min_duration
+        self.refit_interval = refit_interval
+        self.required_passes = required_passes
+        self.next_refit = refit_interval
+        self.passes = 0
+        self.last_c = None
+        self.refits = 0
+        self.reason = "max_duration"
+        self.fits = []
+
+    def due(self, elapsed):
+        return elapsed >= self.next_refit
+
+    #t is the seconds since the start of the soak, ys has the data to fit for each watched channel
+    def check(self, elapsed, t, ys):
+        self.next_refit = elapsed + self.refit_interval
+        self.refits += 1
+        self.fits = [fit_exponential(t, y) for y in ys]
+        c = [i.c for i in self.fits]
+        converged = all(i.ok() and i.tau_rel_err() < self.tau_tolerance for i in self.fits)
+        if (converged and self.last_c is not None):
+            for fit, last in zip(self.fits, self.last_c):
+                if (abs(fit.c - last) > self.asymptote_tolerance * (abs(fit.a) + abs(fit.c))):
+                    converged = False
+        else:
+            converged = False
+        if (converged and len(t)):
+            for fit in self.fits:
+                if (abs(fit.a) * math.exp(-fit.tau * t[-1]) >= self.asymptote_tolerance * abs(fit.c)):
+                    converged = False
+        self.last_c = c
+        if (converged):
+            self.passes += 1
+        else:
+            self.passes = 0
+        if ((self.passes >= self.required_passes) and (elapsed >= self.min_duration)):
+            self.reason = "converged"
+            return True
+        return False
@@ -0,0 +1,196 @@
+import os
+import math
+import time
+from datetime import datetime
+from hv_sampler import HVSampler
+
+#Runs the HV phases of several groups of PCB channels ("lanes") at the same time, from one sampling loop
+#Each lane only ever touches its own CAEN channels and its own bits of the relay bytes, so one lane can be ramping or discharging
+#while another is soaking. Only one lane ramps up at a time, the next one starts its ramp once the previous one has settled,
+#which staggers the lanes so that one's ramp time is hidden under another's soak
+#Every tick the monitors of all 16 CAEN channels are read once, and the row goes to every capture that's running
+#A lane is a generator that does one step of its phase sequence each tick and yields while it's waiting on something
+#The fits and plots of a finished capture are held until sampling ends, so they never hold up a tick
+#The lanes' CAEN and relay commands still go out inside the tick they're issued in, and a tick that runs over the interval
+#makes the sampler skip the ticks it missed. Those skips are expected, hv_sampling['pipeline'] counts the ticks that sent commands
+class HVPipeline:
+    def __init__(self, measure):
+        self.prefix = "HV Pipeline"
+        self.measure = measure
+        self.json_data = measure.json_data
+        self.c = measure.c
+        self.k = measure.k
+        self.relay_hv = 0
+        self.relay_term = 0
+        self.ramping_up = None          #The lane that's ramping up, the others wait their turn
+        self.captures = []
+        self.now = None
+        self.monitors = None
+        self.event_rows = []
+        self.status = None
+        self.results = []               #Fits and plots of finished captures, done once sampling is over
+        self.commanded = False          #Set by a lane that sent the CAEN or relays a command this tick
+
+    #Runs every phase for every group, filling in hv_results the same way LDOmeasure.hv_phase does
+    def run(self, groups, phases, hv_results):
+        from hv_trace import HVTraceWriter
+        self.writer_class = HVTraceWriter
+        #The sampler runs until every lane is done
+        self.sampler = HVSampler(self.json_data['hv_seconds_interval'], math.inf, self.json_data['hv_late_policy'])
+        lanes = [self.lane(num, group, phases, hv_results) for num, group in enumerate(groups)]
+        print(f"{self.prefix} --> Running {len(lanes)} lanes, {groups}")
+        command_ticks = 0
+        try:
+            for tick in self.sampler:
+                last = self.now
+                self.now = datetime.now()
+                #With events on, the changes pushed since the last tick go to the captures ahead of this tick's row
+                if (self.monitors is not None):
+                    self.event_rows = self.c.get_monitor_events(last.timestamp(), self.now.timestamp(), *self.monitors)
+                self.monitors = self.c.get_monitors()
+                self.status = self.c.get_values(self.c.channels, "Status")
+                for capture in list(self.captures):
+                    self.write_capture(capture)
+                self.commanded = False
+                for lane in list(lanes):
+                    try:
+                        next(lane)
+                    except StopIteration:
+                        lanes.remove(lane)
+                if (self.commanded):
+                    command_ticks += 1
+                if (not lanes):
+                    break
+        finally:
+            #If the test is aborted, whatever the running captures got so far is still saved
+            for capture in self.captures:
+                capture['writer'].close()
+                print(f"{self.prefix} --> Capture aborted, {capture['writer'].rows} rows were kept in {capture['name']}")
+        stats = self.sampler.stats()
+        stats['skips_by_design'] = True
+        stats['command_ticks'] = command_ticks
+        self.measure.datastore['hv_sampling']['pipeline'] = stats
+        if (stats['late_samples'] or stats['skipped_ticks']):
+            print(f"{self.prefix} --> {stats['late_samples']} samples were late and {stats['skipped_ticks']} were skipped, worst was {round(stats['lateness_max'], 3)} seconds late")
+            print(f"{self.prefix} --> Lanes sent commands during {command_ticks} ticks, ticks they ran over are skipped by design")
+        print(f"{self.prefix} --> All lanes finished after {round(self.sampler.elapsed() / 60, 2)} minutes")
+        for results in self.results:
+            self.measure.hv_phase_results(*results)
+
+    def lane(self, num, group, phases, hv_results):
+        for polarity, term in phases:
+            phase = self.measure.hv_phase_settings(group, polarity, term)
+            chs = phase['chs']
+
+            #Wait for any other lane to finish ramping up
+            while (self.ramping_up is not None):
+                yield
+            self.ramping_up = num
+            self.commanded = True
+            self.c.set_HV_value(chs, phase['v'])
+            print(f"{self.prefix} --> Lane {num} turning Channels {chs} HV from 0 to {phase['sign']}{phase['v']}V with {phase['description']}")
+            yield from self.set_relay(phase['mask'], phase['hv_mask'], phase['term_mask'])
+            self.commanded = True
+            value = self.c.start_power(chs, True)
+            yield from self.wait_for_ramp(chs, value, phase['v'])
+            self.ramping_up = None
+            print(f"{self.prefix} --> Lane {num} HV reached max value, waiting {phase['wait']} seconds to stabilize...")
+            yield from self.wait(phase['wait'])
+
+            capture = self.start_capture(self.measure.hv_phase_csv(phase, True), [(ch, True, phase['term']) for ch in chs])
+            while (not capture['done']):
+                yield
+            voltages = [self.monitors[0][ch] for ch in chs]
+            currents = [self.monitors[1][ch] for ch in chs]
+            self.results.append((group, phase, True, capture['trace'], hv_results, voltages, currents))
+
+            print(f"{self.prefix} --> Lane {num} turning Channels {chs} HV from {phase['sign']}{phase['v']}V to 0 with {phase['description']}")
+            self.commanded = True
+            value = self.c.start_power(chs, False)
+            yield from self.wait_for_ramp(chs, value, 0)
+
+            capture = self.start_capture(self.measure.hv_phase_csv(phase, False), [(ch, False, phase['term']) for ch in chs])
+            while (not capture['done']):
+                yield
+            self.results.append((group, phase, False, capture['trace'], hv_results))
+
+    #Only this lane's bits of the relay bytes are changed, the other lanes keep theirs
+    #The fan and heater tests may be using the Keysight, if so the lane waits a tick rather than holding up the sampling
+    def set_relay(self, mask, hv, term):
+        keysight = self.measure.station.lock("keysight")
+        while (not keysight.acquire(blocking = False)):
+            yield
+        self.commanded = True
+        try:
+            self.relay_hv = (self.relay_hv & ~mask) | hv
+            self.relay_term = (self.relay_term & ~mask) | term
+            self.k.set_relay(self.relay_hv, self.relay_term)
+        finally:
+            keysight.release()
+
+    #Same as the wrapper's wait_for_ramps, but yields between checks instead of sleeping, and uses the status and monitors read every tick
+    def wait_for_ramp(self, chs, value, target):
+        start = time.monotonic()
+        while (True):
+            yield
+            for ch in chs:
+                if (self.status[ch] > 0x7):
+                    self.c.channel_error(ch, self.status[ch])
+            elapsed = time.monotonic() - start
+            if (all(self.c.ramp_done(self.status[ch], self.monitors[0][ch], target, value, elapsed) for ch in chs)):
+                return
+
+    def wait(self, seconds):
+        start = time.monotonic()
+        while ((time.monotonic() - start) < seconds):
+            yield
+
+    #A capture takes the rows for hv_minutes_duration from the next tick on, then it's closed and its trace handed back
+    #In adaptive mode it can finish early once the fits of the watched channels converge, the same as LDOmeasure.record_hv_data
+    def start_capture(self, name, watch):
+        duration = self.json_data['hv_minutes_duration'] * 60
+        binary = (self.json_data['hv_trace_binary'] == "True")
+        capacity = math.ceil(duration / self.sampler.interval)
+        print(f"{self.prefix} --> Collecting data for {name} for {self.json_data['hv_minutes_duration']} minutes starting at {datetime.now()}...")
+        self.measure.start_station_tests()
+        capture = {}
+        capture['name'] = name
+        capture['writer'] = self.writer_class(os.path.join(self.measure.results_path, name), self.json_data['hv_trace_flush_rows'], self.json_data['hv_trace_fsync'], binary, len(self.c.channels), capacity)
+        capture['start'] = None
+        capture['duration'] = duration
+        capture['done'] = False
+        capture['event_rows'] = 0
+        capture['trace'] = None
+        capture['watch'] = watch
+        capture['monitor'] = self.measure.hv_convergence_monitor(watch)
+        self.captures.append(capture)
+        return capture
+
+    def write_capture(self, capture):
+        elapsed = self.sampler.elapsed()
+        if (capture['start'] is None):
+            capture['start'] = elapsed
+        if ((elapsed - capture['start']) >= capture['duration']):
+            self.finish_capture(capture, elapsed)
+            return
+        if (capture['writer'].rows):
+            for t, voltages, currents in self.event_rows:
+                capture['writer'].writerow(self.measure.hv_row(datetime.fromtimestamp(t), voltages, currents))
+            capture['event_rows'] += len(self.event_rows)
+        capture['writer'].writerow(self.measure.hv_row(self.now, *self.monitors))
+        monitor = capture['monitor']
+        if (monitor and monitor.due(elapsed - capture['start'])):
+            trace = capture['writer'].trace()
+            if (monitor.check(elapsed - capture['start'], trace.elapsed(), [self.measure.hv_fit_data(trace, *i) for i in capture['watch']])):
+                self.finish_capture(capture, elapsed)
+
+    def finish_capture(self, capture, elapsed):
+        capture['writer'].close()
+        capture['trace'] = capture['writer'].trace()
+        capture['done'] = True
+        self.captures.remove(capture)
+        #Where this capture sits in the pipeline's sampling, the timing statistics are for the whole pipeline
+        stats = {"pipeline_start": capture['start'], "samples": capture['writer'].rows, "event_rows": capture['event_rows']}
+        if (capture['monitor']):
+            self.measure.hv_early_stop_stats(stats, capture['monitor'], elapsed - capture['start'], capture['duration'])
+        self.measure.datastore['hv_sampling'][capture['name']] = stats
@@ -0,0 +1,82 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+#matplotlib takes a good fraction of a second to import, so it's only loaded the first time a plot is actually drawn
+#When the pool is used, that's in the worker processes and the test script never loads it at all
+#Plots are only ever saved to file, and the non-interactive backend is safe to use off the main thread and in worker processes
+def load_pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+#Draws the current and voltage of one channel on twin axes and saves it as a PNG
+#This is a plain function of its arguments so it can run in a worker process
+def render_hv_plot(png_path, name, ch_time, ch_voltage, ch_current, fit = None, axes = None):
+    plt = load_pyplot()
+    fig = plt.figure(figsize=(16, 12), dpi=80)
+    ax = fig.add_subplot(1,1,1)
+
+    ax.plot(ch_time, ch_current, label="Ch Current")
+    format_plot(ax)
+
+    ax2 = ax.twinx()
+    ax2.plot(ch_time, ch_voltage, label="Ch Voltage", color="red")
+
+    fig.suptitle((name), fontsize=36)
+
+    ax.set_xlabel("Time (Minutes:Seconds)", fontsize=24)
+    ax.set_ylabel("Current (uA)", fontsize=24)
+
+    # ax.set_xlim([0,150])
+    if (axes):
+        ax2.set_ylim([axes[0],axes[1]])
+    ax2.set_ylabel("Voltage (V)", fontsize=24)
+    format_plot(ax2)
+
+    if fit:
+        textstr = r'$\tau=%.4f$' % (fit)
+        props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+        ax.text(0.75, 0.75, textstr, transform=ax.transAxes, fontsize=24,
+        verticalalignment='top', bbox=props)
+
+    fig.legend(loc='lower left', prop={'size': 20}, ncol=2)
+    fig.savefig(png_path)
+    plt.close(fig)
+
+def format_plot(ax):
+    import matplotlib.dates as mdates
+    tick_size = 18
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%M:%S'))
+    ax.tick_params(axis='x', labelsize=tick_size, colors='black')  # Set tick size and color here
+    ax.tick_params(axis='y', labelsize=tick_size, colors='black')  # Set tick size and color here
+
+#Renders plots in background worker processes so the test sequence only pays for queueing them
+#The workers are started the first time a plot is submitted. With 0 workers, plots are drawn right away in this process
+#Workers are spawned rather than forked, the CAEN library runs its own threads and forking a process with threads isn't safe
+class PlotPool:
+    def __init__(self, workers):
+        self.prefix = "Plot Pool"
+        self.workers = workers
+        self.executor = None
+        self.jobs = []
+
+    def submit(self, png_path, *args, **kwargs):
+        if (self.workers < 1):
+            render_hv_plot(png_path, *args, **kwargs)
+            return
+        if (self.executor is None):
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.jobs.append((png_path, self.executor.submit(render_hv_plot, png_path, *args, **kwargs)))
+
+    #Blocks until every queued plot is saved. A plot that fails is reported but doesn't stop the test
+    def wait(self):
+        for png_path, job in self.jobs:
+            try:
+                job.result()
+            except Exception as e:
+                print(f"{self.prefix} --> WARNING: Plot {png_path} could not be made: {e}")
+        self.jobs = []
+        if (self.executor is not None):
+            self.executor.shutdown()
+            self.executor = None
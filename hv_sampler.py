@@ -0,0 +1,76 @@
+import sys
+import math
+import time
+import statistics
+
+#Paces the HV data taking. Instead of spinning on time.time() for the whole soak, it sleeps until the next deadline
+#Deadlines are on a fixed grid from time.monotonic(), so a wall clock or NTP change can't move them around
+#If a sample takes long enough that the next deadline(s) already passed, the policy decides what to do:
+#   "skip"    - drop the missed ticks and take one sample right away for the most recent one, staying on the grid
+#   "catchup" - take every missed tick back to back until the schedule has caught up
+#Use it as a loop, for sample in sampler: ..., and break out of the loop to stop early
+class HVSampler:
+    policies = ["skip", "catchup"]
+
+    def __init__(self, interval, duration, policy = "skip"):
+        self.prefix = "HV Sampler"
+        if (policy not in self.policies):
+            sys.exit(f"{self.prefix} --> Late sample policy {policy} is not one of {self.policies}")
+        if (interval <= 0):
+            sys.exit(f"{self.prefix} --> Sample interval needs to be positive, it was {interval}")
+        self.interval = interval
+        self.duration = duration
+        self.policy = policy
+        #A sample that is later than this past its deadline is counted as late in the statistics
+        self.late_tolerance = 0.1 * interval
+        self.lateness = []          #Seconds each sample was taken after its deadline
+        self.sample_times = []      #Seconds since the start that each sample was taken
+        self.skipped = 0
+        self.start = None
+
+    def __iter__(self):
+        self.start = time.monotonic()
+        end = self.start + self.duration
+        tick = 0
+        while True:
+            deadline = self.start + (tick * self.interval)
+            if (deadline >= end):
+                break
+            now = time.monotonic()
+            if (now < deadline):
+                time.sleep(deadline - now)
+                now = time.monotonic()
+            self.lateness.append(now - deadline)
+            self.sample_times.append(now - self.start)
+            yield tick
+            tick += 1
+            if (self.policy == "skip"):
+                #Index of the latest deadline that has already gone by
+                latest = int((time.monotonic() - self.start) // self.interval)
+                if (latest > tick):
+                    self.skipped += latest - tick
+                    tick = latest
+
+    def elapsed(self):
+        if (self.start is None):
+            return 0
+        return time.monotonic() - self.start
+
+    #Summary of how well the deadlines were kept, meant to go into the datastore JSON
+    #Jitter is the standard deviation of the time between consecutive samples
+    def stats(self):
+        periods = [j - i for i, j in zip(self.sample_times[:-1], self.sample_times[1:])]
+        results = {}
+        results['policy'] = self.policy
+        results['interval'] = self.interval
+        #A sampler that runs until it's stopped has no duration, and JSON has no infinity
+        results['duration'] = self.duration if math.isfinite(self.duration) else None
+        results['samples'] = len(self.lateness)
+        results['skipped_ticks'] = self.skipped
+        results['late_samples'] = sum(1 for i in self.lateness if i > self.late_tolerance)
+        results['lateness_mean'] = statistics.fmean(self.lateness) if self.lateness else 0
+        results['lateness_max'] = max(self.lateness, default = 0)
+        results['period_mean'] = statistics.fmean(periods) if periods else 0
+        results['jitter'] = statistics.pstdev(periods) if len(periods) > 1 else 0
+        results['lateness'] = [round(i, 6) for i in self.lateness]
+        return results
@@ -0,0 +1,228 @@
+import os
+import sys
+import csv
+import struct
+from datetime import datetime
+import numpy as np
+
+#HV captures are saved in two ways, both written as the data comes in
+#   CSV    - one row per sample, the timestamp as str(datetime) followed by voltage and current for each CAEN channel
+#   Binary - a columnar bundle of 2 .npy files next to the CSV, which numpy can memory map instead of parsing
+#            {stem}_time.npy is float64 seconds since the epoch, one per sample
+#            {stem}_vi.npy is float32 samples x channels x 2, where the last axis is (voltage, current)
+#The CSV is kept as the human readable export, readers should go through load_trace() which prefers the binary files
+
+def trace_paths(path):
+    stem = os.path.splitext(path)[0]
+    return f"{stem}.csv", f"{stem}_time.npy", f"{stem}_vi.npy"
+
+#In memory (or memory mapped) view of a capture, the arrays are not copied when they come from the binary files
+#If only some channels were loaded, channels lists which CAEN channel each column of vi is
+class HVTrace:
+    def __init__(self, timestamps, vi, channels = None):
+        self.timestamps = timestamps    #Seconds since the epoch for each sample
+        self.vi = vi                    #Samples x channels x (voltage, current)
+        self.channels = channels
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def column(self, ch):
+        if (self.channels is None):
+            return ch
+        return self.channels.index(ch)
+
+    def voltage(self, ch):
+        return self.vi[:, self.column(ch), 0]
+
+    def current(self, ch):
+        return self.vi[:, self.column(ch), 1]
+
+    #Seconds since the first sample
+    def elapsed(self):
+        return self.timestamps - self.timestamps[0]
+
+    #Time since the first sample as datetime64 values from an arbitrary start date, which is what the Minutes:Seconds plot axis wants
+    #Keeps the sub-second part and doesn't roll over after an hour
+    def plot_time(self):
+        return np.datetime64('2024-01-01T00:00:00') + np.round(self.elapsed() * 1E6).astype('timedelta64[us]')
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as fp:
+            csv_writer = csv.writer(fp, delimiter=',')
+            for t, row in zip(self.timestamps, self.vi):
+                datum = [datetime.fromtimestamp(t)]
+                for v, c in row:
+                    datum.append(float(v))
+                    datum.append(float(c))
+                csv_writer.writerow(datum)
+
+#Fit and plot functions take either a capture already in memory or the path to one on disk
+#For CSV files, channels picks which CAEN channels to parse, all of them if not given
+def load_trace(path, channels = None):
+    if (isinstance(path, HVTrace)):
+        return path
+    csv_path, time_path, vi_path = trace_paths(path)
+    if (os.path.isfile(time_path) and os.path.isfile(vi_path)):
+        timestamps = np.load(time_path, mmap_mode='r')
+        vi = np.load(vi_path, mmap_mode='r')
+        #If a capture was cut off between the two files being flushed, only use the samples both have
+        rows = min(len(timestamps), len(vi))
+        return HVTrace(timestamps[:rows], vi[:rows])
+    return load_trace_csv(csv_path, channels)
+
+#Older captures only exist as CSV. The whole file is parsed in one pass by numpy rather than row by row
+#The timestamps are str(datetime), which numpy reads straight into datetime64 (with or without the microseconds)
+def load_trace_csv(path, channels = None):
+    if (channels is None):
+        with open(path, 'r') as csvfile:
+            columns = csvfile.readline().count(',') + 1
+        cols = list(range(columns))
+    else:
+        channels = list(channels)
+        cols = [0]
+        for ch in channels:
+            cols += [1 + (ch*2), 2 + (ch*2)]
+    raw = np.loadtxt(path, delimiter=',', dtype=str, usecols=cols, ndmin=2)
+    times = raw[:, 0].astype('datetime64[us]')
+    vi = raw[:, 1:].astype(np.float32).reshape(len(raw), -1, 2)
+    #datetime64 has no time zone, so line the first sample up with what datetime makes of it as local time and keep the offsets exact
+    if (len(times)):
+        first = datetime.fromisoformat(raw[0, 0]).timestamp()
+        timestamps = first + (times - times[0]).astype(np.float64) / 1E6
+    else:
+        timestamps = np.empty(0, dtype=np.float64)
+    return HVTrace(timestamps, vi, channels)
+
+#Appends rows to a .npy file without knowing in advance how many there will be
+#The header is written with room to spare, and rewritten with the real row count every flush so the file is always loadable
+class NpyStream:
+    header_space = 128      #Bytes reserved for the header, more than enough for any row count
+
+    def __init__(self, path, dtype, row_shape = ()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self.fp = open(self.path, 'wb')
+        self.write_header()
+
+    def write_header(self):
+        shape = (self.rows,) + self.row_shape
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(self.dtype), shape)
+        #Magic string, version 1.0 and the header length take up 10 bytes, the header is padded with spaces and ends in a newline
+        header = header.ljust(self.header_space - 10 - 1) + "\n"
+        self.fp.seek(0)
+        self.fp.write(b"\x93NUMPY\x01\x00" + struct.pack('<H', len(header)) + header.encode('latin1'))
+        self.fp.seek(0, os.SEEK_END)
+
+    def write(self, values):
+        self.fp.write(np.asarray(values, dtype=self.dtype).tobytes())
+        self.rows += 1
+
+    def flush(self):
+        self.write_header()
+        self.fp.flush()
+
+    def fileno(self):
+        return self.fp.fileno()
+
+    @property
+    def closed(self):
+        return self.fp.closed
+
+    def close(self):
+        if (self.fp.closed):
+            return
+        self.flush()
+        self.fp.close()
+
+#Writes HV capture rows to disk as they come in rather than holding the whole soak in memory
+#Every flush_rows rows the buffered rows are pushed to the OS, so a crash or sys.exit only loses what hasn't been flushed yet
+#The fsync policy decides how hard we try to get the data onto the disk itself:
+#   "never"  - leave it to the OS, survives the script dying but not the computer
+#   "close"  - fsync once when the file is closed
+#   "flush"  - fsync at every flush, survives a power cut at the cost of a disk sync per flush
+#With binary on, the columnar .npy files are written alongside the CSV
+#With a capacity given, the rows are also kept in preallocated arrays so the capture can be handed straight to the fit and plots
+#with trace(), rather than having them read the files back. The arrays only grow if the capture runs past the capacity
+#Use it as a context manager so the files get flushed and closed even when the capture is aborted
+class HVTraceWriter:
+    fsync_policies = ["never", "close", "flush"]
+
+    def __init__(self, path, flush_rows = 1, fsync = "close", binary = False, channels = 16, capacity = None):
+        self.prefix = "HV Trace Writer"
+        if (fsync not in self.fsync_policies):
+            sys.exit(f"{self.prefix} --> fsync policy {fsync} is not one of {self.fsync_policies}")
+        if (flush_rows < 1):
+            sys.exit(f"{self.prefix} --> Rows between flushes needs to be at least 1, it was {flush_rows}")
+        self.path = path
+        self.flush_rows = flush_rows
+        self.fsync = fsync
+        self.channels = channels
+        self.rows = 0
+        self.unflushed = 0
+        self.fp = open(self.path, 'w', newline='')
+        self.csv_writer = csv.writer(self.fp, delimiter=',')
+        self.streams = [self.fp]
+        if (binary):
+            csv_path, time_path, vi_path = trace_paths(self.path)
+            self.time_stream = NpyStream(time_path, np.float64)
+            self.vi_stream = NpyStream(vi_path, np.float32, (self.channels, 2))
+            self.streams += [self.time_stream, self.vi_stream]
+        else:
+            self.time_stream = None
+            self.vi_stream = None
+        if (capacity is not None):
+            self.timestamps = np.empty(max(capacity, 1), dtype=np.float64)
+            self.vi = np.empty((max(capacity, 1), self.channels, 2), dtype=np.float32)
+        else:
+            self.timestamps = None
+            self.vi = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if (exc_type is not None):
+            print(f"{self.prefix} --> Capture aborted, {self.rows} rows were kept in {self.path}")
+
+    #A row is the timestamp as a datetime followed by voltage and current for each channel
+    def writerow(self, row):
+        self.csv_writer.writerow(row)
+        if (self.time_stream):
+            self.time_stream.write(row[0].timestamp())
+            self.vi_stream.write(np.reshape(row[1:], (self.channels, 2)))
+        if (self.timestamps is not None):
+            if (self.rows == len(self.timestamps)):
+                self.timestamps = np.concatenate((self.timestamps, np.empty_like(self.timestamps)))
+                self.vi = np.concatenate((self.vi, np.empty_like(self.vi)))
+            self.timestamps[self.rows] = row[0].timestamp()
+            self.vi[self.rows] = np.reshape(row[1:], (self.channels, 2))
+        self.rows += 1
+        self.unflushed += 1
+        if (self.unflushed >= self.flush_rows):
+            self.flush()
+
+    #The rows written so far, only available when the writer was given a capacity
+    def trace(self):
+        if (self.timestamps is None):
+            sys.exit(f"{self.prefix} --> Asked for the in memory trace of {self.path}, but the writer wasn't keeping one")
+        return HVTrace(self.timestamps[:self.rows], self.vi[:self.rows])
+
+    def flush(self):
+        for i in self.streams:
+            i.flush()
+            if (self.fsync == "flush"):
+                os.fsync(i.fileno())
+        self.unflushed = 0
+
+    def close(self):
+        for i in self.streams:
+            if (i.closed):
+                continue
+            i.flush()
+            if (self.fsync != "never"):
+                os.fsync(i.fileno())
+            i.close()
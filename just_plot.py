@@ -1,30 +1,32 @@
 import os, sys
-import csv
 import json
 import matplotlib
 import matplotlib.dates as mdates
-import matplotlib.ticker as mticker
-from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
-from matplotlib.ticker import MultipleLocator
-import numpy as np
-from scipy.optimize import curve_fit
-from dune_hv_crate_test import LDOmeasure
+from pathlib import Path
+#Only the trace reader and plotting helpers are needed here, not the hardware test script and its instrument drivers
+from hv_trace import load_trace
+from hv_plot import render_hv_plot
 
 class JustPlot:
     def __init__(self, path):
-        self.orig = LDOmeasure()
-        self.orig.results_path = path
+        self.results_path = path
         self.test_name = self.get_test_name()
 
     def get_test_name(self):
-        for f in os.listdir(self.orig.results_path):
+        for f in os.listdir(self.results_path):
             if f.endswith(".json"):
-                json_file = os.path.join(self.orig.results_path, f)
+                json_file = os.path.join(self.results_path, f)
                 with open(json_file, "r") as jsonfile:
                     self.json_data = json.load(jsonfile)
                     return (self.json_data["test_name"])
 
+    #Redraws the plot for one channel of a capture in the results directory, the same way the test does
+    def make_plot(self, filename, name, ch, fit=None, axes = None):
+        trace = load_trace(os.path.join(self.results_path, filename), [ch])
+        stem = Path(filename).stem
+        render_hv_plot(os.path.join(self.results_path, f"{stem}.png"), name, trace.plot_time(), trace.voltage(ch), trace.current(ch), fit, axes)
+
     def plot_multiple(self, base, timestamps):
         self.multiplot(base, timestamps, "_ch0_pos_open_on", 0, "c", "Open termination, charging current, 0V to 2000V", 'upper right')
         self.multiplot(base, timestamps, "_ch0_neg_open_on", 8, "c", "Open termination, charging current, 0V to -2000V", 'upper right')
@@ -43,12 +45,13 @@ class JustPlot:
         volts = []
         currs = []
         for ts, ch in zip(timestamps, arr):
+            #The reader uses the memory mapped binary files if the run has them, and falls back to the CSV if not
             filename = os.path.join(base, ts, f"channel{ch}{test}.csv")
             print(filename)
-            time, volt, curr = self.get_ch_data(filename, ch_num)
-            times.append(time)
-            volts.append(volt)
-            currs.append(curr)
+            trace = load_trace(filename, [ch_num])
+            times.append(trace.plot_time())
+            volts.append(trace.voltage(ch_num))
+            currs.append(trace.current(ch_num))
 
         fig = plt.figure(figsize=(16, 12), dpi=80)
         ax = fig.add_subplot(1,1,1)
@@ -85,7 +88,7 @@ class JustPlot:
 if __name__ == "__main__":
     jp = JustPlot("/home/dune-daq/DUNE-HV-Crate-Testing/results/20240708162535")
 
-    jp.orig.make_plot(f"{jp.test_name}_ch0_pos_open_on.csv", "0 to 2000V, open termination redid", 0, fit = None, axes = [1990, 2030])
+    jp.make_plot(f"{jp.test_name}_ch0_pos_open_on.csv", "0 to 2000V, open termination redid", 0, fit = None, axes = [1990, 2030])
 
     #results_path = "/home/dune-daq/DUNE-HV-Crate-Testing/results"
     #jp.plot_multiple(results_path, ["20240318142641", "20240318151109", "20240318155445", "20240318163921", "20240318172152", "20240318180505", "20240319102102", "20240319110328"])
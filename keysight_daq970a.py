@@ -4,6 +4,9 @@ Created on Wed Sept 25 10:51:58 2023
 
 @author: Eraguzin
 """
+import sys
+import time
+import numpy as np
 
 class Keysight970A:
     def __init__(self, rm, json_data):
@@ -13,13 +16,24 @@ class Keysight970A:
         print(f"{self.prefix} --> Connected to {self.keysight.query('*IDN?')}")
         self.keysight.write("*RST")
 
+        #What the instrument is set to right now, so that commands already in effect aren't sent again
+        #Everything is back to defaults after the reset above, so this starts empty
+        self.settings = {}          #Header -> value, for settings of the whole instrument like the reading format and trigger
+        self.configured = {}        #Measurement (rtd, resistance, fan) -> (channel list, commands) that its channels were last configured with
+        self.scan_list = None
+
         #Common commands
-        self.keysight.write("SYSTem:BEEPer:STATe ON")
         #self.keysight.write("SYSTem:BEEPer:IMMediate")
-        self.keysight.write("FORMat:READing:CHANnel ON")
+        self.transaction(self.setting("SYSTem:BEEPer:STATe", "ON") + self.setting("FORMat:READing:CHANnel", "ON"))
+
+        #Keeps track of state to make sure commands don't collide. It's the measurements whose channels are in the scan list right now
+        self.state = ()
 
-        #Keeps track of state to make sure commands don't collide
-        self.state = None
+        #In buffered mode the scans are started with INIT and pulled out of reading memory once they're all done,
+        #instead of a READ? with a fixed wait. Binary mode sends the readings as 64 bit floats rather than text
+        #Both have only been tried against a stand-in for the DAQ so far, so they're off by default
+        self.buffered = (self.json_data['keysight970a_buffered'] == "True")
+        self.binary = (self.json_data['keysight970a_binary'] == "True")
 
         #Build the string of the list of RTD channels
         self.rtd_ch_list = ""
@@ -63,40 +77,89 @@ class Keysight970A:
             else:
                 self.fan_ch_list += (f",{ch_string}")
 
+        #Each measurement's channel list, how its channels map to the test's numbering, how long READ? waits, and how many scans buffered mode averages
+        self.measurements = {}
+        self.measurements['rtd'] = {"ch_list": self.rtd_ch_list, "convert": self.rtd_convert, "delay": self.json_data['keysight970a_rtd_delay'], "samples": self.json_data['keysight970a_rtd_samples']}
+        self.measurements['resistance'] = {"ch_list": self.heater_ch_list, "convert": self.heater_convert, "delay": self.json_data['keysight970a_heater_delay'], "samples": self.json_data['keysight970a_heater_samples']}
+        self.measurements['fan'] = {"ch_list": self.fan_ch_list, "convert": self.fan_convert, "delay": self.json_data['keysight970a_fan_delay'], "samples": self.json_data['keysight970a_fan_samples']}
+
     def clear_scan_list(self):
         self.keysight.write("ROUTe:SCAN (@)")
+        self.scan_list = "@"
 
     def initialize_rtd(self):
-        #Keysight DAQ970A requires you to do a Configure first and then change the parameters with Sense
-        #Configure sets the resistance of the RTD, and default resolution
-        #It also updates the scan list so only the channels in this Configure command are scanned
-        self.keysight.write(f"CONFigure:TEMPerature:RTD {self.json_data['keysight970a_rtd_RES']},DEF,({self.rtd_ch_list})")
+        self.initialize_scan(["rtd"])
 
-        #Sets the sample rate a little slower for accuracy, whether in low power mode or not, and units to use
-        self.keysight.write(f"SENSe:TEMPerature:NPLCycles {self.json_data['keysight970a_rtd_NPLcycles']},({self.rtd_ch_list})")
-        self.keysight.write(f"SENSe:TEMPerature:TRANsducer:RTD:POWer:LIMit:STATe {self.json_data['keysight970a_rtd_LowPower']},({self.rtd_ch_list})")
-        self.keysight.write(f"UNIT:TEMPerature {self.json_data['keysight970a_rtd_units']},({self.rtd_ch_list})")
-        self.keysight.write("FORMat:READing:CHANnel ON")
+    def initialize_resistance(self):
+        self.initialize_scan(["resistance"])
 
-        self.state = "rtd"
+    def initialize_fan(self):
+        self.initialize_scan(["fan"])
 
-    def initialize_resistance(self):
-        self.keysight.write(f"CONFigure:RESistance AUTO,DEF,({self.heater_ch_list})")
-        self.keysight.write(f"SENSe:RESistance:NPLCycles {self.json_data['keysight970a_heater_NPLcycles']},({self.heater_ch_list})")
-        self.keysight.write(f"SENSe:RESistance:POWer:LIMit:STATe {self.json_data['keysight970a_heater_LowPower']},({self.heater_ch_list})")
-        self.keysight.write(f"SENSe:RESistance:OCOMpensated {self.json_data['keysight970a_heater_ocomp']},({self.heater_ch_list})")
-        self.keysight.write("FORMat:READing:CHANnel ON")
+    #Every channel keeps its own function, so the channels of several measurements can share one scan list and be read in one scan
+    #Measurements that were configured before only need the scan list changed. What's needed goes out as one transaction
+    def initialize_scan(self, measurements):
+        pending = []
+        for measurement in measurements:
+            pending += self.configure(measurement, self.measurements[measurement]['ch_list'], self.measurement_commands(measurement))
+        ch_list = "@" + ",".join(ch for measurement in measurements for ch in self.measurements[measurement]['convert'])
+        if (self.scan_list != ch_list):
+            pending.append(f"ROUTe:SCAN ({ch_list})")
+            self.scan_list = ch_list
+        #READ? needs the channel tags to tell the readings apart, in buffered mode the scan sets the format it needs
+        if (not self.buffered):
+            pending += self.setting("FORMat:READing:CHANnel", "ON")
+        self.transaction(pending)
+        self.state = tuple(measurements)
 
-        self.state = "resistance"
+    def measurement_commands(self, measurement):
+        if (measurement == "rtd"):
+            #Keysight DAQ970A requires you to do a Configure first and then change the parameters with Sense
+            #Configure sets the resistance of the RTD, and default resolution
+            #It also updates the scan list so only the channels in this Configure command are scanned
+            #Then sets the sample rate a little slower for accuracy, whether in low power mode or not, and units to use
+            return [f"CONFigure:TEMPerature:RTD {self.json_data['keysight970a_rtd_RES']},DEF,({self.rtd_ch_list})",
+                    f"SENSe:TEMPerature:NPLCycles {self.json_data['keysight970a_rtd_NPLcycles']},({self.rtd_ch_list})",
+                    f"SENSe:TEMPerature:TRANsducer:RTD:POWer:LIMit:STATe {self.json_data['keysight970a_rtd_LowPower']},({self.rtd_ch_list})",
+                    f"UNIT:TEMPerature {self.json_data['keysight970a_rtd_units']},({self.rtd_ch_list})"]
+        if (measurement == "resistance"):
+            return [f"CONFigure:RESistance AUTO,DEF,({self.heater_ch_list})",
+                    f"SENSe:RESistance:NPLCycles {self.json_data['keysight970a_heater_NPLcycles']},({self.heater_ch_list})",
+                    f"SENSe:RESistance:POWer:LIMit:STATe {self.json_data['keysight970a_heater_LowPower']},({self.heater_ch_list})",
+                    f"SENSe:RESistance:OCOMpensated {self.json_data['keysight970a_heater_ocomp']},({self.heater_ch_list})"]
+        if (measurement == "fan"):
+            return [f"CONFigure:VOLTage:DC AUTO,DEF,({self.fan_ch_list})",
+                    f"SENSe:VOLTage:DC:NPLCycles {self.json_data['keysight970a_fan_NPLcycles']},({self.fan_ch_list})",
+                    f"SENSe:VOLTage:DC:ZERO:AUTO {self.json_data['keysight970a_fan_autozero']},({self.fan_ch_list})",
+                    f"SENSe:VOLTage:DC:IMPedance:AUTO {self.json_data['keysight970a_fan_autoimpedance']},({self.fan_ch_list})"]
 
-    def initialize_fan(self):
-        self.keysight.write(f"CONFigure:VOLTage:DC AUTO,DEF,({self.fan_ch_list})")
-        self.keysight.write(f"SENSe:VOLTage:DC:NPLCycles {self.json_data['keysight970a_fan_NPLcycles']},({self.fan_ch_list})")
-        self.keysight.write(f"SENSe:VOLTage:DC:ZERO:AUTO {self.json_data['keysight970a_fan_autozero']},({self.fan_ch_list})")
-        self.keysight.write(f"SENSe:VOLTage:DC:IMPedance:AUTO {self.json_data['keysight970a_fan_autoimpedance']},({self.fan_ch_list})")
-        self.keysight.write("FORMat:READing:CHANnel ON")
+    #Gives back the commands to configure a measurement's channels, or nothing if they're still configured that way
+    def configure(self, measurement, ch_list, commands):
+        if (self.configured.get(measurement) == (ch_list, commands)):
+            return []
+        #Configure puts these channels back to their defaults and makes them the scan list, so everything for the measurement is sent again
+        #It also resets the trigger, and any other measurement sharing these channels has lost its settings
+        channels = set(ch_list[1:].split(","))
+        for other, (other_list, other_commands) in list(self.configured.items()):
+            if (channels & set(other_list[1:].split(","))):
+                del self.configured[other]
+        self.configured[measurement] = (ch_list, commands)
+        self.settings = {header: value for header, value in self.settings.items() if not header.startswith("TRIGger")}
+        self.scan_list = ch_list
+        return list(commands)
+
+    #Gives back the command to change an instrument wide setting, or nothing if it's already set that way
+    def setting(self, header, value):
+        if (self.settings.get(header) == str(value)):
+            return []
+        self.settings[header] = str(value)
+        return [f"{header} {value}"]
 
-        self.state = "fan"
+    #Sends the commands as one line, with a single *OPC? at the end so this returns once the instrument has done them all
+    def transaction(self, commands):
+        if (not commands):
+            return
+        self.keysight.query(";:".join(commands) + ";*OPC?")
 
     #Sets the output channels for the HV relay control. Easier to split it into 2 blocks with separate functions
     def set_relay(self, hv, term):
@@ -114,46 +177,99 @@ class Keysight970A:
         self.keysight.write(f"SOURce:DIGital:DATA:BYTE {term},(@{self.json_data['keysight970a_907A_slot']}02)")
 
     def measure_rtd(self):
-        if (self.state != "rtd"):
-            print(f"{self.prefix} --> Tried to measure temperature without being in the temperature state! State is {self.state}!")
-            return None
-        #Response is something like
-        #['+9.90000000E+2', '101', '+9.90000000E+2', '102', '+9.90000000E+1', '103', '+9.90000000E+0', '104\n']
-        #Get rid of /n at the end of the string
-        resp = self.keysight.query("READ?", delay = self.json_data['keysight970a_rtd_delay']).strip()
-        #Split commas into lists
-        sep = resp.split(",")
-        #Make a dictionary with the channel as the key and the float reading as value
-        results = {}
-        for i in range(0,(self.num_rtds * 2)-1,2):
-            results[self.rtd_convert[f"{sep[i+1]}"]] = float(sep[i])
-
-        return results
+        return self.measure_view("rtd", "temperature")
 
     def measure_resistance(self):
-        if (self.state != "resistance"):
-            print(f"{self.prefix} --> Tried to measure resistance without being in the resistance state! State is {self.state}!")
-            return None
-        resp = self.keysight.query("READ?", delay = self.json_data['keysight970a_heater_delay']).strip()
-        sep = resp.split(",")
-        results = {}
-        for i in range(0,(self.num_rtds * 2)-1,2):
-            results[self.heater_convert[f"{sep[i+1]}"]] = float(sep[i])
-
-        return results
+        return self.measure_view("resistance", "resistance")
 
     def measure_fan(self):
-        if (self.state != "fan"):
-            print(f"{self.prefix} --> Tried to measure fan without being in the fan state! State is {self.state}!")
+        return self.measure_view("fan", "fan")
+
+    #The measure functions are views of one scan, so they work the same whether their channels were scanned alone or along with others
+    def measure_view(self, measurement, name):
+        if (measurement not in self.state):
+            print(f"{self.prefix} --> Tried to measure {name} without being in the {name} state! State is {self.state}!")
             return None
-        resp = self.keysight.query("READ?", delay = self.json_data['keysight970a_fan_delay']).strip()
-        #Split commas into lists
-        sep = resp.split(",")
-        results = {}
-        for i in range(0,(self.num_fans * 2)-1,2):
-            results[self.fan_convert[f"{sep[i+1]}"]] = float(sep[i])
-
-        return results
+        return self.measure()[measurement]
+
+    #Scans every channel in the scan list once and gives back {measurement: {index: reading}} for each measurement in it
+    #In buffered mode each reading is the average of as many scans as the measurement that wants the most
+    def measure(self):
+        if (self.buffered):
+            times, readings = self.scan(max(self.measurements[i]['samples'] for i in self.state))
+            return {measurement: {i: float(readings[measurement][i].mean()) for i in readings[measurement]} for measurement in readings}
+        #Response is something like
+        #+9.90000000E+2,111,+9.90000000E+2,112,+9.90000000E+1,113,+9.90000000E+0,114\n
+        resp = self.keysight.query("READ?", delay = max(self.measurements[i]['delay'] for i in self.state)).strip()
+        readings = self.views(self.parse_readings(np.array(resp.split(","), dtype = float)))
+        return {measurement: {i: float(readings[measurement][i][0]) for i in readings[measurement]} for measurement in readings}
+
+    #Runs count scans of the scan list, spaced interval seconds apart by the instrument's own timer (0 is back to back)
+    #Returns the time of each scan from the first one, and {measurement: {index: array of count readings}}
+    def scan(self, count, interval = 0):
+        self.start_scans(count, interval)
+        readings = self.remove_scans(count, self.json_data['keysight970a_scan_timeout'])
+        return np.arange(count) * interval, self.views(readings)
+
+    #The settings go out in the same line as INIT. No *OPC? here, it would wait for the whole scan to finish
+    def start_scans(self, count, interval = 0):
+        pending = []
+        if (self.binary):
+            pending += self.setting("FORMat:READing:CHANnel", "OFF")
+            pending += self.setting("FORMat:DATA", "REAL,64")
+        else:
+            pending += self.setting("FORMat:READing:CHANnel", "ON")
+            pending += self.setting("FORMat:DATA", "ASCii,9")
+        pending += self.setting("TRIGger:SOURce", "TIMer")
+        pending += self.setting("TRIGger:TIMer", interval)
+        pending += self.setting("TRIGger:COUNt", count)
+        self.keysight.write(";:".join(pending + ["INIT"]))
+
+    #Waits until the reading memory has the given number of whole scans, then takes them out in one transfer
+    #Anything that wants the scans as they come in (a long timer scan) can call this with fewer scans at a time
+    #If they don't all come in time the scan is aborted and the test stops, a partial scan can't be split up by channel
+    def remove_scans(self, scans, timeout):
+        points = scans * len(self.scan_channels())
+        start = time.monotonic()
+        while (int(self.keysight.query("DATA:POINts?")) < points):
+            if ((time.monotonic() - start) > timeout):
+                taken = self.keysight.query("DATA:POINts?").strip()
+                self.abort_scans()
+                sys.exit(f"{self.prefix} --> Only {taken} of {points} readings were taken after {timeout} seconds, the scan was aborted")
+            time.sleep(self.json_data['keysight970a_scan_poll'])
+        if (self.binary):
+            data = self.keysight.query_binary_values(f"DATA:REMove? {points}", datatype = "d", is_big_endian = True, container = np.array)
+        else:
+            data = np.array(self.keysight.query(f"DATA:REMove? {points}").strip().split(","), dtype = float)
+        return self.parse_readings(data)
+
+    #Stops the scan and takes out whatever it left in the reading memory, so none of it turns up in the next DATA:REMove?
+    def abort_scans(self):
+        self.keysight.write("ABORt")
+        left = int(self.keysight.query("DATA:POINts?"))
+        print(f"{self.prefix} --> Aborted the scan, throwing away the {left} readings it left in memory")
+        if (left):
+            self.keysight.write(f"DATA:REMove? {left}")
+            self.keysight.read_raw()
+
+    def scan_channels(self):
+        return [ch for measurement in self.state for ch in self.measurements[measurement]['convert']]
+
+    #Splits readings into an array for each channel in the scan list
+    #With channel tags every reading is followed by its channel number. Without them (binary), each scan has one reading per channel
+    #in the order the instrument scans them, which is by channel number and not the order they were listed
+    def parse_readings(self, data):
+        if (self.settings.get("FORMat:READing:CHANnel") == "ON"):
+            data = data.reshape(-1, 2)
+            channels = data[:, 1].astype(int)
+            return {ch: data[channels == int(ch), 0] for ch in self.scan_channels()}
+        order = sorted(self.scan_channels(), key = int)
+        data = data.reshape(-1, len(order))
+        return {ch: data[:, num] for num, ch in enumerate(order)}
+
+    #Splits the readings of each channel by measurement, using the test's numbering for the channels
+    def views(self, readings):
+        return {measurement: {index: readings[ch] for ch, index in self.measurements[measurement]['convert'].items()} for measurement in self.state}
 
     def beep(self):
         self.keysight.write("SYSTem:BEEPer:IMMediate")
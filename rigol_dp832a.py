@@ -4,6 +4,7 @@ Created on Wed Sept 25 10:51:58 2023
 
 @author: Eraguzin
 """
+import sys
 
 class RigolDP832A:
     def __init__(self, rm, json_data, index):
@@ -12,71 +13,103 @@ class RigolDP832A:
         #There are 2 Rigols in this setup, the index determines which one this is
         self.rigol = rm.open_resource(self.json_data[f'rigol832a{index}'])
         print(f"{self.prefix} --> Connected to {self.rigol.query('*IDN?')}")
-        self.rigol.write("*RST")
+        self.reset()
         self.rigol.write("SYSTem:BEEPer:STATe ON")
         #self.rigol.write("SYSTem:BEEPer:IMMediate")
         self.channels = []
+        #Name -> local channel number, worked out once when each channel is set up
+        self.channel_numbers = {}
         self.index = index
         self.channel_num = 3
+        #Config key prefix for the settings of each channel name
+        self.channel_keys = {"fan": "fan", "heat_supply": "heater_supply", "heat_switch": "heater_switch", "hvpullup": "hvpullup", "hvpullup2": "hvpullup2", "fanread": "fanread"}
+        #Reading several channels at once asks for all of them in one line. If this Rigol doesn't answer that properly, it goes back to one query per channel
+        self.combined_query = (self.json_data['rigol832a_combined_query'] == "True")
+
+    #Back to the power on defaults. Anything sent before is undone, so the settings that were kept track of are forgotten too
+    #Settings sent since the reset are kept as header -> value, so setting something again to the same value costs nothing
+    def reset(self):
+        self.rigol.write("*RST")
+        self.settings = {}
 
     #This way of initializing each channel and then adding it to a list that gets checked ensures that the higher level test code doesn't mistake which type of channel is on which Rigol
     #So the first Rigol has channels 1,2, and 3. The second Rigol has channels 4,5, and 6. And this converts it to the local Rigol nomenclature
     def setup_fan(self):
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fan_ch'] - (self.channel_num * self.index)}:VOLTage:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_fan_voltage']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fan_ch'] - (self.channel_num * self.index)}:CURRent:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_fan_current']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fan_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:LEVel {self.json_data['rigol832a_fan_overcurrent']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fan_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:STATe {self.json_data['rigol832a_fan_overcurrent_en']}")
-        self.channels.append("fan")
+        self.setup_channels(["fan"])
 
     def setup_heater_supply(self):
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_supply_ch'] - (self.channel_num * self.index)}:VOLTage:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_heater_supply_voltage']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_supply_ch'] - (self.channel_num * self.index)}:CURRent:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_heater_supply_current']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_supply_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:LEVel {self.json_data['rigol832a_heater_supply_overcurrent']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_supply_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:STATe {self.json_data['rigol832a_heater_supply_overcurrent_en']}")
-        self.channels.append("heat_supply")
+        self.setup_channels(["heat_supply"])
 
     def setup_heater_switch(self):
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_switch_ch'] - (self.channel_num * self.index)}:VOLTage:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_heater_switch_voltage']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_switch_ch'] - (self.channel_num * self.index)}:CURRent:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_heater_switch_current']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_switch_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:LEVel {self.json_data['rigol832a_heater_switch_overcurrent']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_heater_switch_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:STATe {self.json_data['rigol832a_heater_switch_overcurrent_en']}")
-        self.channels.append("heat_switch")
+        self.setup_channels(["heat_switch"])
 
     def setup_hvpullup(self):
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup_ch'] - (self.channel_num * self.index)}:VOLTage:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_hvpullup_voltage']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup_ch'] - (self.channel_num * self.index)}:CURRent:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_hvpullup_current']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:LEVel {self.json_data['rigol832a_hvpullup_overcurrent']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:STATe {self.json_data['rigol832a_hvpullup_overcurrent_en']}")
-        self.channels.append("hvpullup")
+        self.setup_channels(["hvpullup"])
 
     def setup_hvpullup2(self):
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup2_ch'] - (self.channel_num * self.index)}:VOLTage:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_hvpullup2_voltage']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup2_ch'] - (self.channel_num * self.index)}:CURRent:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_hvpullup2_current']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup2_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:LEVel {self.json_data['rigol832a_hvpullup2_overcurrent']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_hvpullup2_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:STATe {self.json_data['rigol832a_hvpullup2_overcurrent_en']}")
-        self.channels.append("hvpullup2")
+        self.setup_channels(["hvpullup2"])
 
     def setup_fanread(self):
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fanread_ch'] - (self.channel_num * self.index)}:VOLTage:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_fanread_voltage']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fanread_ch'] - (self.channel_num * self.index)}:CURRent:LEVel:IMMediate:AMPLitude {self.json_data['rigol832a_fanread_current']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fanread_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:LEVel {self.json_data['rigol832a_fanread_overcurrent']}")
-        self.rigol.write(f"SOURce{self.json_data['rigol832a_fanread_ch'] - (self.channel_num * self.index)}:CURRent:PROTection:STATe {self.json_data['rigol832a_fanread_overcurrent_en']}")
-        self.channels.append("fanread")
+        self.setup_channels(["fanread"])
+
+    #Sets up every named channel with the voltage, current and overcurrent protection from the config, all in one transaction
+    #Settings that were already sent with the same value are skipped
+    def setup_channels(self, names):
+        pending = []
+        for name in names:
+            key = self.channel_keys[name]
+            chan = self.json_data[f'rigol832a_{key}_ch'] - (self.channel_num * self.index)
+            pending += self.setting(f"SOURce{chan}:VOLTage:LEVel:IMMediate:AMPLitude", self.json_data[f'rigol832a_{key}_voltage'])
+            pending += self.setting(f"SOURce{chan}:CURRent:LEVel:IMMediate:AMPLitude", self.json_data[f'rigol832a_{key}_current'])
+            pending += self.setting(f"SOURce{chan}:CURRent:PROTection:LEVel", self.json_data[f'rigol832a_{key}_overcurrent'])
+            pending += self.setting(f"SOURce{chan}:CURRent:PROTection:STATe", self.json_data[f'rigol832a_{key}_overcurrent_en'])
+            if (name not in self.channels):
+                self.channels.append(name)
+            self.channel_numbers[name] = chan
+        self.transaction(pending)
 
-    #Because I want to decouple the name of the channel with the actual number, this will need to be called every time
+    #Gives back the command to change a setting, or nothing if it's already set that way
+    def setting(self, header, value):
+        if (self.settings.get(header) == str(value)):
+            return []
+        self.settings[header] = str(value)
+        return [f"{header} {value}"]
+
+    #Sends the commands as one line with SYSTem:ERRor? at the end, so there's one round trip and it comes back once they've all been done
+    #Only if that reports an error or never answers are the commands sent again one at a time, in case this Rigol doesn't take several commands in one line
+    def transaction(self, commands):
+        if (not commands):
+            return
+        try:
+            errors = self.get_errors(";:".join(commands) + ";:SYSTem:ERRor?")
+        except Exception as e:
+            errors = [f"no answer ({e})"]
+            #Anything left of a late answer would otherwise be read back as the answer to the next query
+            self.rigol.clear()
+        if (errors):
+            print(f"{self.prefix} --> WARNING: Rigol {self.index} reported {errors} for the combined setup, sending the commands one at a time")
+            for i in commands:
+                self.rigol.write(i)
+            errors = self.get_errors("SYSTem:ERRor?")
+            if (errors):
+                print(f"{self.prefix} --> WARNING: Rigol {self.index} reported {errors} while being set up with {commands}")
+                #Not sure which ones took, so they'll all be sent again next time
+                for i in commands:
+                    self.settings.pop(i.split(" ")[0], None)
+
+    #Sends the query, which has to end in SYSTem:ERRor?, and reads out the error queue until it's empty
+    def get_errors(self, query):
+        errors = []
+        resp = self.rigol.query(query).strip()
+        while (not resp.startswith("0,") and len(errors) < 20):
+            errors.append(resp)
+            resp = self.rigol.query("SYSTem:ERRor?").strip()
+        return errors
+
+    #Because I want to decouple the name of the channel with the actual number, the setup functions keep track of which number each name is
     def get_ch_with_name(self, ch):
-        if (ch == "fan" and "fan" in self.channels):
-            return self.json_data['rigol832a_fan_ch'] - (self.channel_num * self.index)
-        elif (ch == "heat_supply" and "heat_supply" in self.channels):
-            return self.json_data['rigol832a_heater_supply_ch'] - (self.channel_num * self.index)
-        elif (ch == "heat_switch" and "heat_switch" in self.channels):
-            return self.json_data['rigol832a_heater_switch_ch'] - (self.channel_num * self.index)
-        elif (ch == "hvpullup" and "hvpullup" in self.channels):
-            return self.json_data['rigol832a_hvpullup_ch'] - (self.channel_num * self.index)
-        elif (ch == "hvpullup2" and "hvpullup2" in self.channels):
-            return self.json_data['rigol832a_hvpullup2_ch'] - (self.channel_num * self.index)
-        elif (ch == "fanread" and "fanread" in self.channels):
-            return self.json_data['rigol832a_fanread_ch'] - (self.channel_num * self.index)
+        if (ch in self.channel_numbers):
+            return self.channel_numbers[ch]
         else:
             print(f"{self.prefix} --> WARNING: Did not understand channel type {ch}")
             print(f"{self.prefix} --> WARNING: Channels initialized for Rigol {self.index} are {self.channels}")
@@ -103,6 +136,38 @@ class RigolDP832A:
             volt = self.rigol.query(f"MEASure:VOLTage:DC? CH{chan}")
             return float(volt)
 
+    #Voltage, current and power of each named channel, from MEASure:ALL? which gives all three at once
+    #Returns {name: {"voltage": V, "current": A, "power": W}}, every channel that's been set up if no names are given
+    def read_all(self, names = None):
+        if (names is None):
+            names = self.channels
+        chans = [self.get_ch_with_name(ch) for ch in names]
+        if (0 in chans):
+            return None
+        queries = [f"MEASure:ALL? CH{chan}" for chan in chans]
+        responses = None
+        if (self.combined_query and len(queries) > 1):
+            try:
+                responses = self.rigol.query(";:".join(queries)).strip().split(";")
+            except Exception as e:
+                print(f"{self.prefix} --> WARNING: Combined query failed ({e})")
+            if (responses is None or len(responses) != len(queries) or any(len(i.split(",")) != 3 for i in responses)):
+                print(f"{self.prefix} --> WARNING: Rigol {self.index} didn't answer the combined query properly, reading one channel at a time from now on")
+                self.combined_query = False
+                responses = None
+                #Whatever is left of the combined answer would otherwise be read back as the answer to the next query
+                self.rigol.clear()
+        if (responses is None):
+            responses = [self.rigol.query(i).strip() for i in queries]
+        results = {}
+        for ch, resp in zip(names, responses):
+            try:
+                voltage, current, power = (float(i) for i in resp.split(","))
+            except ValueError:
+                sys.exit(f"{self.prefix} --> Rigol {self.index} answered {resp} when asked for the voltage, current and power of {ch}")
+            results[ch] = {"voltage": voltage, "current": current, "power": power}
+        return results
+
     def check_overcurr_protection(self, ch):
         chan = self.get_ch_with_name(ch)
         if (chan != 0):
@@ -0,0 +1,106 @@
+import sys
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+#Runs parts of the station's test sequence at the same time, each in its own thread
+#Every instrument has a lock. Anything that talks to an instrument holds its lock for the whole exchange, so a sequence like
+#configuring the Keysight for RTDs and then reading them can't have another test's configuration land in the middle
+#Tests can also wait on each other with signal() and wait_for(), for example the heater waiting for the fans to turn off
+#sys.exit() in a thread only ends that thread, so anything a task raises is handed back to the main thread once all tasks are done
+#The results spreadsheet isn't thread safe either, so every write to it and every save holds the workbook lock
+#Within a test, gather() sends calls to different instruments at the same time so waiting on them costs the slowest one, not the sum
+class StationScheduler:
+    def __init__(self, instruments):
+        self.prefix = "Station Scheduler"
+        self.locks = {i: threading.RLock() for i in instruments}
+        #Each instrument gets one worker thread for gather(), so calls to the same instrument still go one at a time
+        self.executors = {i: ThreadPoolExecutor(1, thread_name_prefix = i) for i in instruments}
+        self.signals = {}
+        self.signals_lock = threading.Lock()
+        self.workbook = threading.RLock()
+
+    def lock(self, instrument):
+        return self.locks[instrument]
+
+    def event(self, name):
+        with self.signals_lock:
+            if (name not in self.signals):
+                self.signals[name] = threading.Event()
+            return self.signals[name]
+
+    def signal(self, name):
+        self.event(name).set()
+
+    def wait_for(self, name):
+        self.event(name).wait()
+
+    #Tells the running tasks to stop at their next sleep(), for when the rest of the test has already failed
+    def stop(self):
+        self.signal("stop")
+
+    #Waits like time.sleep(), but if stop() is called in the meantime the task ends right there
+    def sleep(self, seconds):
+        if (self.event("stop").wait(seconds)):
+            sys.exit(f"{self.prefix} --> Stopped while waiting")
+
+    #The drivers are synchronous PyVISA wrappers, so each call runs on its instrument's worker thread and is awaited from there
+    #The worker holds the instrument's lock for the call, so tasks using the instrument directly are kept out in the meantime
+    async def call(self, instrument, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executors[instrument], self.locked, instrument, function, args)
+
+    #Gives back (result, error). A driver's sys.exit() can't be raised inside the event loop, it would stop the loop with the other calls still going
+    def locked(self, instrument, function, args):
+        with self.locks[instrument]:
+            try:
+                return function(*args), None
+            except BaseException as e:
+                return None, e
+
+    #Runs every (instrument, function, *args) at the same time and returns their results in the same order
+    #If any of them fails, the others are still waited for, then the first error is raised here
+    #The caller can't be holding any of these instruments' locks, or their workers would wait on it forever
+    def gather(self, *calls):
+        async def gather_calls():
+            return await asyncio.gather(*(self.call(*i) for i in calls))
+        results = asyncio.run(gather_calls())
+        for result, error in results:
+            if (error is not None):
+                raise error
+        return [result for result, error in results]
+
+    def close(self):
+        for i in self.executors.values():
+            i.shutdown()
+
+    #tasks is a list of (name, function), they all start together and this returns when they've all finished
+    def run(self, tasks):
+        self.join(self.start(tasks))
+
+    #Starts the tasks and returns right away, hand what this returns to join() to wait for them
+    def start(self, tasks):
+        threads = [StationTask(name, function) for name, function in tasks]
+        for i in threads:
+            i.start()
+        return threads
+
+    def join(self, threads):
+        for i in threads:
+            i.join()
+        for i in threads:
+            if (i.error is not None):
+                print(f"{self.prefix} --> {i.name} stopped with {type(i.error).__name__}: {i.error}")
+                raise i.error
+
+class StationTask(threading.Thread):
+    def __init__(self, name, function):
+        super().__init__(name = name)
+        self.function = function
+        self.error = None
+
+    def run(self):
+        try:
+            self.function()
+        except BaseException as e:
+            self.error = e